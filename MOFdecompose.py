@@ -1,4 +1,6 @@
 import os
+import sys
+import importlib
 import pandas as pd
 import numpy as np
 from numpy import sin,cos
@@ -7,6 +9,21 @@ import argparse
 import networkx as nx
 import datetime
 import shutil
+import time
+import json
+import hashlib
+import gzip
+import zipfile
+import tarfile
+import mmap
+import resource
+import traceback
+import heapq
+import re
+import shlex
+import string
+import multiprocessing
+import multiprocessing.connection
 from pathlib import Path 
 import pathlib
 
@@ -25,6 +42,9 @@ class LIBRARY:
         self.cifextension = '.cif'
         self.xyzextension = '.xyz'
         
+        # Bond skin
+        self.skin = 0.18
+        
         # Metal info
         self.METALcsv = self.dir + "metal.csv"
         self.dfmetal = pd.read_csv(self.METALcsv)
@@ -34,93 +54,207 @@ class LIBRARY:
         self.ATRcsv = self.dir + "atr.csv"
         self.dfatr = pd.read_csv(self.ATRcsv)
         
-class ATOM(LIBRARY):
+        # Element tables indexed by element id (the first row of the symbol in
+        # atr.csv), compiled once so no DataFrame is scanned per atom
+        self.elementsymbol = [str(symbol) for symbol in self.dfatr['Symbol']]
+        self.elementid = {}
+        for id, symbol in enumerate(self.elementsymbol):
+            self.elementid.setdefault(symbol, id)
+        self.elementatr = self.dfatr['atr'].to_numpy(dtype = np.float64)
+        self.elementmetal = np.isin(self.elementsymbol, [str(symbol) for symbol in self.metalsymbol])
+        
+        # Squared bond cutoff (atr_i + atr_j + skin)^2 and squared overlap
+        # distance ((atr_i + atr_j)/2)^2 of every element pair
+        cutoff = self.elementatr[:, None] + self.elementatr[None, :] + self.skin
+        self.paircutoff2 = cutoff * cutoff
+        overlap = (self.elementatr[:, None] + self.elementatr[None, :]) / 2.0
+        self.pairoverlap2 = overlap * overlap
+        
+        # Candidate pairs expanded at a time by the neighbor search, bounds the
+        # temporary arrays
+        self.pairblock = 1 << 22
+        
+        # Neighbor search selection: the KD-tree is used when the block of grid
+        # cells searched around an atom holds more than kdtreeratio times the
+        # atoms of the cutoff sphere, and more than kdtreeminpairs atoms
+        self.kdtreeratio = 16.0
+        self.kdtreeminpairs = 256.0
+        self.kdtreeleafsize = 8
+        
+    def get_elementid(self, symbol):
+        try:
+            return self.elementid[symbol]
+        except KeyError:
+            raise ValueError('ATR not found')
+        
+    def get_atr(self, symbol):
+        return self.elementatr[self.get_elementid(symbol)]
+        
+class ATOM:
+    
+    # View of one row of the MOF atom table, for callers that still work on
+    # mof.atom[i].symbol, .x, .neighborlist, ... The data stays in the MOF arrays,
+    # .x and .writex are rows of mof.frac and mof.wrapped and write through.
     
     dim = 3
-    lib = LIBRARY()
     
-    def __init__ (self, data, index):
-        #self.label = data[0]
-        self.label = data[1] + str(index + 1)
-        self.symbol = data[1]
+    def __init__ (self, mof, index):
+        self.mof = mof
         self.index = index
         
-        self.neighborlist = []
-        self.nneighbor = 0
+    @property
+    def symbol(self):
+        return self.mof.get_symbol(self.index)
         
-        self.gridindex = 0
+    @property
+    def label(self):
+        return self.mof.get_atomlabel(self.index)
         
-        self.ismetal = False
+    @property
+    def x(self):
+        return self.mof.frac[self.index]
         
-        self.x = []
-        self.writex = []
+    @property
+    def writex(self):
+        return self.mof.wrapped[self.index]
         
-        for idim in range(self.dim):
-            self.x.append(data[idim+3])
-            self.writex.append(data[idim+3])
-            
-        self.atr = self.get_atr()
+    @property
+    def atr(self):
+        return self.mof.atr[self.index]
         
-    def destroy(self, array):
-        del array
-        array = []
-        return array
-    
-    def destroy_all(self):
-        del self.label
-        del self.symbol
-
-        del self.neighborlist
-        del self.x
-        del self.writex
-            
-    def get_atr(self):
-        try:
-            atr = self.lib.dfatr.iloc[self.lib.dfatr[(self.lib.dfatr['Symbol'] == self.symbol)].index[0]]['atr']
-        except:
-            raise ValueError('ATR not found')
-        return atr
+    @property
+    def ismetal(self):
+        return bool(self.mof.ismetal[self.index])
+        
+    @ismetal.setter
+    def ismetal(self, value):
+        self.mof.ismetal[self.index] = value
+        
+    @property
+    def gridindex(self):
+        return int(self.mof.gridindex[self.index])
+        
+    @gridindex.setter
+    def gridindex(self, value):
+        self.mof.gridindex[self.index] = value
+        
+    @property
+    def neighborlist(self):
+        return self.mof.neighborlist[self.index]
+        
+    @property
+    def nneighbor(self):
+        return len(self.mof.neighborlist[self.index])
     
     def print_info(self):
         print(self.index, end = ' ')
         print(self.label, end = ' ')
         print(self.symbol, end = ' ')
-        print(self.x, end = ' ')
+        print(list(self.x), end = ' ')
         print(self.atr)
     
-    def setnneighborzero(self):
-        self.nneighbor = 0
-    
     def check_neighbor(self, iindex):
-        
-        check = False
-        for ineighbor in self.neighborlist:
-            if ineighbor == iindex:
-                check = True
-                
-        return check
+        return iindex in self.mof.neighborlist[self.index]
     
     def add_neighbor(self, iindex):
-        check = False
-        
-        if len(self.neighborlist) > 0:
-            check = self.check_neighbor(iindex)
-            
-        if check == False:
-            self.neighborlist.append(iindex)
+        if iindex not in self.mof.neighborlist[self.index]:
+            self.mof.neighborlist[self.index].append(iindex)
         
     def remove_neighbor(self, iindex):
-        currentneighborlist = []
-        currentneighborlist = self.neighborlist
-        self.neighborlist = self.destroy(self.neighborlist)
-
-        for ineighbor in currentneighborlist:
-            if ineighbor != iindex:
-                self.add_neighbor(ineighbor)
-                
-        del currentneighborlist
+        self.mof.neighborlist[self.index] = [ineighbor for ineighbor in self.mof.neighborlist[self.index] if ineighbor != iindex]
+        
+class ATOMLIST:
+    
+    # mof.atom: len(), indexing and iteration over ATOM views
+    
+    def __init__ (self, mof):
+        self.mof = mof
+        
+    def __len__(self):
+        return len(self.mof.symbols)
+        
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if index < 0 or index >= len(self):
+            raise IndexError('atom index out of range')
+        return ATOM(self.mof, index)
+        
+    def __iter__(self):
+        for index in range(len(self)):
+            yield ATOM(self.mof, index)
         
-class MOF(ATOM,LIBRARY):
+class KDTREE:
+    
+    # Balanced KD-tree over an N x 3 array of points, built and searched one level
+    # at a time with NumPy instead of node by node. Node k of level l holds the
+    # points order[bounds[l][k]:bounds[l][k+1]] with bounds[l][k] = (k*N) >> l,
+    # and is split at that median along the longest side of its box.
+    
+    def __init__ (self, points, leafsize = 8):
+        self.points = points
+        self.nlevel = 0
+        self.lo = []
+        self.hi = []
+        self.bounds = []
+        self.order = np.arange(len(points))
+        if len(points) == 0:
+            return
+        
+        while (len(points) >> self.nlevel) > leafsize:
+            self.nlevel += 1
+        
+        for level in range(self.nlevel + 1):
+            bounds = (np.arange((1 << level) + 1) * len(points)) >> level
+            x = points[self.order]
+            self.lo.append(np.minimum.reduceat(x, bounds[:-1]))
+            self.hi.append(np.maximum.reduceat(x, bounds[:-1]))
+            self.bounds.append(bounds)
+            if level < self.nlevel:
+                node = np.repeat(np.arange(1 << level), np.diff(bounds))
+                axis = np.argmax(self.hi[level] - self.lo[level], axis = 1)
+                key = x[np.arange(len(points)), axis[node]]
+                self.order = self.order[np.lexsort((key, node))]
+        
+    def query_pairs(self, queries, radius, block = 1 << 14):
+        
+        # index pairs [query, point] closer than radius. The (query, node) pairs
+        # whose box is within radius are refined level by level, for a block of
+        # queries at a time, and the points of the leaves reached are tested.
+        radius2 = radius * radius
+        qindex = []
+        pindex = []
+        if len(self.lo) == 0:
+            return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+        
+        for start in range(0, len(queries), block):
+            query = np.arange(start, min(start + block, len(queries)))
+            node = np.zeros(len(query), dtype = np.int64)
+            for level in range(self.nlevel + 1):
+                if level > 0:
+                    query = np.repeat(query, 2)
+                    node = np.repeat(2 * node, 2) + np.tile([0, 1], len(node))
+                x = queries[query]
+                dx = np.maximum(self.lo[level][node] - x, 0.0) + np.maximum(x - self.hi[level][node], 0.0)
+                keep = (dx * dx).sum(axis = 1) <= radius2
+                query = query[keep]
+                node = node[keep]
+            
+            bounds = self.bounds[self.nlevel]
+            count = bounds[node + 1] - bounds[node]
+            position = np.arange(count.sum()) - np.repeat(np.cumsum(count) - count, count)
+            query = np.repeat(query, count)
+            point = self.order[np.repeat(bounds[node], count) + position]
+            dx = self.points[point] - queries[query]
+            keep = (dx * dx).sum(axis = 1) <= radius2
+            qindex.append(query[keep])
+            pindex.append(point[keep])
+        
+        if len(qindex) == 0:
+            return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+        return np.concatenate(qindex), np.concatenate(pindex)
+
+class MOF(LIBRARY):
     
     lib = LIBRARY()
     dim = 3
@@ -135,12 +269,44 @@ class MOF(ATOM,LIBRARY):
         
         self.lx = []
         self.ar = []
-        self.atom = []
-        self.h = []
-        self.hinv = []
+        self.h = np.zeros((self.dim, self.dim))
+        self.hinv = np.zeros((self.dim, self.dim))
+        
+        #Reduced cell of the neighbor search: lattice basis in units of the
+        #input cell vectors and the input cell and coordinates to go back to
+        self.cellbasis = None
+        self.inputcell = None
         self.atomtypelist = []
         self.metaltypelist = []
         
+        #Atom table, one row per atom: element id (into the LIBRARY tables),
+        #fractional coordinates, coordinates wrapped for writing, atomic radius,
+        #metal flag, grid cell and the neighbor indices. mof.atom gives ATOM
+        #views of the rows.
+        self.symbols = np.zeros(0, dtype = np.int32)
+        self.frac = np.zeros((0, self.dim))
+        self.wrapped = np.zeros((0, self.dim))
+        self.atr = np.zeros(0)
+        self.ismetal = np.zeros(0, dtype = bool)
+        self.gridindex = np.zeros(0, dtype = np.int64)
+        self.neighborlist = []
+        
+        #Bonds in the neighbor lists, a pair bonded through several images once
+        self.nbond = 0
+        
+        #Permutation of the last grid search: atom table index of each position
+        #of the Z-ordered copy it searched
+        self.cellorder = np.zeros(0, dtype = np.int64)
+        
+        #Bond table, one row per bond: atoms i <= j, the lattice translation
+        #of the image of j bonded to i (several rows per pair in cells thinner
+        #than the bond cutoff, i == j for a bond to an image of i itself) and
+        #the distance
+        self.bonds = np.zeros((0, 2), dtype = np.int64)
+        self.bondimage = np.zeros((0, 3), dtype = np.int64)
+        self.bonddistance = np.zeros(0)
+        self.atom = ATOMLIST(self)
+        
         #SBU lists (frag)
         self.linkerlist = []
         self.funcgrouplist = []
@@ -154,7 +320,7 @@ class MOF(ATOM,LIBRARY):
         self.compcapairlist = []
         
         #Grid Informations
-        self.skin = 0.18
+        self.skin = self.lib.skin
         self.gridlxmax = self.skin
         #self.minbondlength2 = 0.63*0.63
         self.totgrid = 1
@@ -164,6 +330,9 @@ class MOF(ATOM,LIBRARY):
         self.neighgrid = []
         self.gridatomlist = []
         
+        #Neighbor search counters, None unless enabled
+        self.counters = None
+        
     def destroy(self, array):
         del array
         array = []
@@ -179,9 +348,14 @@ class MOF(ATOM,LIBRARY):
         del self.lx
         del self.ar
         
-        for iatom in self.atom:
-            iatom.destroy_all()
         del self.atom
+        del self.symbols
+        del self.frac
+        del self.wrapped
+        del self.atr
+        del self.ismetal
+        del self.gridindex
+        del self.neighborlist
         
         del self.h
         del self.hinv
@@ -205,115 +379,181 @@ class MOF(ATOM,LIBRARY):
         del self.neighgrid
         del self.gridatomlist
         
-    def get_boxinfo(self):
+    def get_boxinfo(self, text = None):
+        
+        # read the cell and the _atom_site loop of any CIF, columns by tag name
+        if text is None:
+            cif = read_cif(self.ciffile)
+        else:
+            cif = parse_cif(text.encode('utf-8'))
+        
+        # wrap into [0,1), -1e-17 would otherwise land on 1.0
+        x = cif['x'] - np.floor(cif['x'])
+        x[x >= 1.0] = 0.0
+        
+        self.get_boxinfo_from_arrays(cif['lengths'], cif['angles'], cif['symbol'], x)
+
+    def get_boxinfo_from_cell(self, lengths, angles, sites):
+        
+        #label, symbol, symmetry, ux, uy, uz, occupancy
+        symbols = [data[1] for data in sites]
+        frac = np.array([data[3:6] for data in sites], dtype = np.float64).reshape(-1, self.dim)
+        self.get_boxinfo_from_arrays(lengths, angles, symbols, frac)
+        
+    def get_boxinfo_from_arrays(self, lengths, angles, symbols, frac):
         
-        self.loop = False
-        self.atom = self.destroy(self.atom)
         self.lx = self.destroy(self.lx)
         self.ar = self.destroy(self.ar)
         
-        index = 0
+        for idim in range(self.dim):
+            self.lx.append(float(lengths[idim]))
+            self.ar.append(self.lib.a2r*float(angles[idim]))
         
-        f = open (self.ciffile,'r')
-        lines = f.readlines()
-        f.close()
+        # element ids, looked up once per distinct symbol
+        uniq, inverse = np.unique(np.array(symbols, dtype = str), return_inverse = True)
+        ids = np.array([self.lib.get_elementid(str(symbol)) for symbol in uniq], dtype = np.int32)
         
-        for line in lines:
-            list = line.split()
-
-            if len(list) > 0:
-                if list[0] == '_cell_length_a':
-                    self.lx.append(float(list[1]))
-                if list[0] == '_cell_length_b':
-                    self.lx.append(float(list[1]))
-                if list[0] == '_cell_length_c':
-                    self.lx.append(float(list[1]))
-
-                if list[0] == '_cell_angle_alpha':
-                    self.ar.append(self.lib.a2r*float(list[1]))
-                if list[0] == '_cell_angle_beta':
-                    self.ar.append(self.lib.a2r*float(list[1]))
-                if list[0] == '_cell_angle_gamma':
-                    self.ar.append(self.lib.a2r*float(list[1]))
-
-                if list[0] == 'loop_':
-                    self.loop = True
-
-                if self.loop == True and len(list) > 5:
-                    data = []
-                    #label, symbol, symmetry, ux, uy, uz, occupancy
-                    data.append(list[0])
-                    data.append(list[1])
-                    data.append(int(list[2]))
-                    data.append(float(list[3]))
-                    data.append(float(list[4]))
-                    data.append(float(list[5]))
-                    data.append(float(list[6]))
-                    self.atom.append(ATOM(data,index))
-                    del data
-                    index += 1   
-        del lines
+        natom = len(inverse)
+        self.symbols = ids[inverse].reshape(natom)
+        self.frac = np.array(frac, dtype = np.float64).reshape(natom, self.dim)
+        self.wrapped = self.frac.copy()
+        self.atr = self.lib.elementatr[self.symbols]
+        self.ismetal = np.zeros(natom, dtype = bool)
+        self.gridindex = np.zeros(natom, dtype = np.int64)
+        self.neighborlist = [[] for iindex in range(natom)]
+        
+    def get_symbol(self, iindex):
+        return self.lib.elementsymbol[self.symbols[iindex]]
+        
+    def get_atomlabel(self, iindex):
+        return self.lib.elementsymbol[self.symbols[iindex]] + str(iindex + 1)
 
     def get_hmatrix(self):
-        self.h = self.destroy(self.h)
-            
-        for idim in range(self.dim):
-            data = []
-            for jdim in range(self.dim):
-                data.append(0.0)
-            self.h.append(data)
-            del data
-            
-        #get h-matrix
-        self.h[0][0] = self.lx[0]
-        self.h[0][1] = self.lx[1]*cos(self.ar[2])
-        self.h[0][2] = self.lx[2]*cos(self.ar[1])
-        self.h[1][0] = 0.0
-        self.h[1][1] = self.lx[1]*sin(self.ar[2])
+        
+        #get h-matrix, the cell vectors are its columns
+        h = np.zeros((self.dim, self.dim))
+        h[0, 0] = self.lx[0]
+        h[0, 1] = self.lx[1]*cos(self.ar[2])
+        h[0, 2] = self.lx[2]*cos(self.ar[1])
+        h[1, 1] = self.lx[1]*sin(self.ar[2])
         local = cos(self.ar[0]) - cos(self.ar[1])*cos(self.ar[2])
         local /= sin(self.ar[2])
-        self.h[1][2] = self.lx[2]*local
-        self.h[2][0] = 0.0
-        self.h[2][1] = 0.0
-        self.h[2][2] = self.lx[2]*np.sqrt(1 - cos(self.ar[1])*cos(self.ar[1]) - local*local)
-        
-        for idim in range(self.dim):
-            self.detH *= self.h[idim][idim]
-            
-        self.hinv = self.destroy(self.hinv)
-        ht = []
+        h[1, 2] = self.lx[2]*local
+        h[2, 2] = self.lx[2]*np.sqrt(1 - cos(self.ar[1])*cos(self.ar[1]) - local*local)
+        self.h = h
+        self.detH = h[0, 0]*h[1, 1]*h[2, 2]
+        
+        #get hinv-matrix, the transposed cofactors over the determinant
+        ht = np.zeros((self.dim, self.dim))
+        ht[0, 0] = h[1, 1]*h[2, 2] - h[1, 2]*h[2, 1]
+        ht[1, 0] = h[0, 2]*h[2, 1] - h[0, 1]*h[2, 2]
+        ht[1, 1] = h[0, 0]*h[2, 2] - h[0, 2]*h[2, 0]
+        ht[1, 2] = h[0, 1]*h[2, 0] - h[0, 0]*h[2, 1]
+        ht[2, 0] = h[0, 1]*h[1, 2] - h[0, 2]*h[1, 1]
+        ht[2, 1] = h[0, 2]*h[1, 0] - h[0, 0]*h[1, 2]
+        ht[2, 2] = h[0, 0]*h[1, 1] - h[0, 1]*h[1, 0]
+        self.hinv = ht.T / self.detH
+        
+    def get_reducedbasis(self, delta = 0.75):
+        
+        # LLL reduction of the cell vectors (the columns of h): integer matrix M
+        # with det(M) = 1 such that the columns of h M are a reduced basis of the
+        # same lattice, None when that basis is not more orthogonal than the
+        # input one. The basis is recomputed from the integer M at every step.
+        basis = np.identity(self.dim, dtype = np.int64)
+        k = 1
+        while k < self.dim:
+            b = self.h @ basis
+            for j in reversed(range(k)):
+                bstar = self.get_gramschmidt(b)
+                mu = int(np.rint(b[:, k] @ bstar[:, j] / (bstar[:, j] @ bstar[:, j])))
+                if mu != 0:
+                    basis[:, k] -= mu * basis[:, j]
+                    b = self.h @ basis
+            bstar = self.get_gramschmidt(b)
+            mu = b[:, k] @ bstar[:, k - 1] / (bstar[:, k - 1] @ bstar[:, k - 1])
+            if bstar[:, k] @ bstar[:, k] >= (delta - mu * mu) * (bstar[:, k - 1] @ bstar[:, k - 1]):
+                k += 1
+            else:
+                basis[:, [k - 1, k]] = basis[:, [k, k - 1]]
+                k = max(k - 1, 1)
+        
+        if round(np.linalg.det(basis)) < 0:
+            basis[:, 2] *= -1
+        
+        # orthogonality defect, product of the vector lengths over the volume
+        defect = np.prod(np.linalg.norm(self.h, axis = 0))
+        reduceddefect = np.prod(np.linalg.norm(self.h @ basis, axis = 0))
+        if reduceddefect >= defect * (1.0 - 1e-9):
+            return None
+        return basis
+        
+    def get_gramschmidt(self, b):
+        
+        # Gram-Schmidt orthogonalized columns of b, not normalized
+        bstar = b.astype(np.float64)
+        for k in range(self.dim):
+            for j in range(k):
+                bstar[:, k] -= (b[:, k] @ bstar[:, j]) / (bstar[:, j] @ bstar[:, j]) * bstar[:, j]
+        return bstar
+        
+    def reduce_cell(self):
+        
+        # Replace the cell by its LLL-reduced basis for the neighbor search: the
+        # grid is sized from Cartesian components of the cell vectors, which on
+        # strongly oblique cells gives flat grid cells and large or incomplete
+        # candidate sets. Lengths, angles, h and the fractional coordinates
+        # change, restore_cell goes back to the input cell.
+        basis = self.get_reducedbasis()
+        if basis is None:
+            return
+        
+        self.cellbasis = basis
+        self.inputcell = [list(self.lx), list(self.ar), self.frac.copy()]
+        
+        h = self.h @ basis
+        lx = np.linalg.norm(h, axis = 0)
+        angle = lambda i, j: float(np.arccos(np.clip(h[:, i] @ h[:, j] / (lx[i] * lx[j]), -1.0, 1.0)))
+        self.lx = [float(ilx) for ilx in lx]
+        self.ar = [angle(1, 2), angle(0, 2), angle(0, 1)]
+        
+        frac = self.frac @ np.rint(np.linalg.inv(basis)).T
+        frac -= np.floor(frac)
+        frac[frac >= 1.0] = 0.0
+        self.frac = frac
+        self.get_hmatrix()
+        
+    def restore_cell(self):
+        
+        # Back to the input cell after a reduced neighbor search. The bond images
+        # of the reduced cell are converted to the input cell vectors, including
+        # the lattice translation between the wrapped reduced and input
+        # coordinates of each atom, and the bonds resorted in the grid order of
+        # the input cell so the output is that of an unreduced search.
+        if self.cellbasis is None:
+            return
+        
+        basis = self.cellbasis
+        reduced = self.frac
+        self.lx, self.ar, self.frac = self.inputcell
+        self.cellbasis = None
+        self.inputcell = None
+        self.get_hmatrix()
+        self.get_atomgridinfo()
+        
+        shift = np.rint(self.frac - reduced @ basis.T).astype(np.int64)
+        iindex = self.bonds[:, 0]
+        jindex = self.bonds[:, 1]
+        image = self.bondimage @ basis.T + shift[iindex] - shift[jindex]
+        
+        # a bond of an atom to its own image is kept with the first nonzero
+        # component of the translation positive
+        sign = np.sign(image)
+        first = sign[np.arange(len(image)), np.argmax(sign != 0, axis = 1)] if len(image) > 0 else sign[:, 0]
+        image[(iindex == jindex) & (first < 0)] *= -1
+        
+        self.set_bonds(*self.order_bonds(iindex, jindex, image, self.bonddistance))
         
-        for idim in range(self.dim):
-            data = []
-            for jdim in range(self.dim):
-                data.append(0.0)
-            self.hinv.append(data)
-            ht.append(data)
-            del data
-            
-        #get hinv-matrix
-        ht[0][0] = self.h[1][1]*self.h[2][2] - self.h[1][2]*self.h[2][1]
-        ht[0][1] = 0.0
-        ht[0][2] = 0.0
-
-        ht[1][0] = self.h[0][2]*self.h[2][1] - self.h[0][1]*self.h[2][2]
-        ht[1][1] = self.h[0][0]*self.h[2][2] - self.h[0][2]*self.h[2][0]
-        ht[1][2] = self.h[0][1]*self.h[2][0] - self.h[0][0]*self.h[2][1]
-
-        ht[2][0] = self.h[0][1]*self.h[1][2] - self.h[0][2]*self.h[1][1]
-        ht[2][1] = self.h[0][2]*self.h[1][0] - self.h[0][0]*self.h[1][2]
-        ht[2][2] = self.h[0][0]*self.h[1][1] - self.h[0][1]*self.h[1][0]
-
-        for idim in range(self.dim):
-            for jdim in range(self.dim):
-                self.hinv[idim][jdim] = ht[jdim][idim]
-
-        for idim in range(self.dim):
-            for jdim in range(self.dim):
-                self.hinv[idim][jdim] /= self.detH
-                
-        del ht
-                
     def get_gridinfo(self):
 
         self.gridlxmax = self.get_maxcovbl() + self.skin
@@ -359,43 +599,16 @@ class MOF(ATOM,LIBRARY):
         for idim in range(self.dim):
             self.totgrid *= self.ngrid[idim]
         
+        # neighbor cells of every cell in stencil order, the offsets of
+        # get_gridstencil wrapped onto the grid
         self.neighgrid = self.destroy(self.neighgrid)
-
-        for igrid in range(self.totgrid):
-            igz = math.floor(igrid/(self.ngrid[0]*self.ngrid[1]))
-            igy = math.floor((igrid - igz*self.ngrid[0]*self.ngrid[1])/self.ngrid[0])
-            igx = igrid - igz*self.ngrid[0]*self.ngrid[1] - igy*self.ngrid[0]
-            data = []
-
-            for iz in range(-1,2):
-                iggz = igz + iz
-
-                if iggz < 0:
-                    iggz += self.ngrid[2]
-                elif iggz >= self.ngrid[2]:
-                    iggz -= self.ngrid[2]
-
-                for iy in range(-1,2):
-                    iggy = igy + iy
-
-                    if iggy < 0:
-                        iggy += self.ngrid[1]
-                    elif iggy >= self.ngrid[1]:
-                        iggy -= self.ngrid[1]
-
-                    for ix in range(-1,2):
-                        iggx = igx + ix
-
-                        if iggx < 0:
-                            iggx += self.ngrid[0]
-                        elif iggx >= self.ngrid[0]:
-                            iggx -= self.ngrid[0]
-
-                        currgrid = iggx + iggy * self.ngrid[0] + iggz * self.ngrid[0] * self.ngrid[1]
-                        if currgrid not in data:
-                            data.append(currgrid)
-            self.neighgrid.append(data)
-            del data
+        igrid = np.arange(self.totgrid)
+        cell = np.stack([igrid % self.ngrid[0], igrid // self.ngrid[0] % self.ngrid[1], igrid // (self.ngrid[0] * self.ngrid[1])], axis = 1)
+        neighgrid = []
+        for offset in self.get_gridstencil():
+            neigh = (cell + offset) % self.ngrid
+            neighgrid.append(neigh[:, 0] + self.ngrid[0] * neigh[:, 1] + self.ngrid[0] * self.ngrid[1] * neigh[:, 2])
+        self.neighgrid = np.stack(neighgrid, axis = 1).tolist()
 
     def get_gridindex(self,x):
 
@@ -428,33 +641,34 @@ class MOF(ATOM,LIBRARY):
         
         self.get_gridinfo()
         
-        for iatom in self.atom:
-            iatom.gridindex, found = self.get_gridindex(iatom.x)
-            if found == False:
-                raise NameError('Wrong gridindex')
+        # get_gridindex on all atoms at once, coordinates moved into the cell in place
+        x = self.frac
+        x[x < 0.0] += 1.0
+        x[x > 1.0] -= 1.0
+        igrid = np.ceil(x / np.array(self.gridlx)).astype(np.int64)
+        igrid[igrid == 0] += 1
+        self.gridindex = self.ngrid[0] * self.ngrid[1] * (igrid[:, 2] - 1) + self.ngrid[0] * (igrid[:, 1] - 1) + igrid[:, 0] - 1
+        if (self.gridindex < 0).any():
+            raise NameError('Wrong gridindex')
                 
         self.gridatomlist = self.destroy(self.gridatomlist)
         
+        order = np.argsort(self.gridindex, kind = 'stable')
+        bounds = np.searchsorted(self.gridindex[order], np.arange(self.totgrid + 1))
         for i in range(self.totgrid):
-            self.gridatomlist.append([])
-
-        for iatom in self.atom:
-            self.gridatomlist[iatom.gridindex].append(iatom.index)
+            self.gridatomlist.append(order[bounds[i]:bounds[i+1]].tolist())
                     
     def get_atomtypelist(self):
         self.atomtypelist = self.destroy(self.atomtypelist)
 
-        tempatomtypelist = []
-
-        for iatom in self.atom:
-            if iatom.symbol not in tempatomtypelist:
-                tempatomtypelist.append(iatom.symbol)
-                data = []
-                data.append(iatom.symbol)
-                data.append(self.lib.dfatr.iloc[self.lib.dfatr[(self.lib.dfatr['Symbol'] == iatom.symbol)].index[0]]['atr'])
-                self.atomtypelist.append(data)
-                del data
-        del tempatomtypelist
+        # elements in order of first appearance
+        ids, first = np.unique(self.symbols, return_index = True)
+        for id in ids[np.argsort(first)]:
+            data = []
+            data.append(self.lib.elementsymbol[id])
+            data.append(self.lib.elementatr[id])
+            self.atomtypelist.append(data)
+            del data
                     
     def get_metaltypelist(self):
         self.metaltypelist = self.destroy(self.metaltypelist)
@@ -463,19 +677,17 @@ class MOF(ATOM,LIBRARY):
             raise NameError("Get atomtypelist first")
         else:
             for iatomtype in self.atomtypelist:
-                for imetalsymbol in self.lib.metalsymbol:
-                    if iatomtype[0] == imetalsymbol:
-                        data1 = []
-                        for iatom in self.atom:
-                            if iatom.symbol == imetalsymbol:
-                                data1.append(iatom.index)
-                                iatom.ismetal = True
-                        data2 = []
-                        data2.append(imetalsymbol)
-                        data2.append(data1)
-                        del data1
-                        self.metaltypelist.append(data2)
-                        del data2
+                id = self.lib.elementid[iatomtype[0]]
+                if self.lib.elementmetal[id]:
+                    mask = self.symbols == id
+                    self.ismetal |= mask
+                    data1 = np.nonzero(mask)[0].tolist()
+                    data2 = []
+                    data2.append(iatomtype[0])
+                    data2.append(data1)
+                    del data1
+                    self.metaltypelist.append(data2)
+                    del data2
     
     def fractional_to_cartesian(self, dux):
         dx = []
@@ -485,7 +697,7 @@ class MOF(ATOM,LIBRARY):
             val = 0.0
             
             for j in range(self.dim):
-                val += self.h[i][j] * dux[j]
+                val += self.h[i, j] * dux[j]
                 
             dx.append(val)            
         return dx
@@ -498,7 +710,7 @@ class MOF(ATOM,LIBRARY):
             val = 0.0
             
             for j in range(self.dim):
-                val += self.hinv[i][j] * dx[j]
+                val += self.hinv[i, j] * dx[j]
                 
             dux.append(val)
         return dux
@@ -514,13 +726,7 @@ class MOF(ATOM,LIBRARY):
                         
         return maxcovbl
     
-    def check_bond(self, iatom, jatom):
-
-        maxdx2 = iatom.atr + jatom.atr + self.skin
-        maxdx2 *= maxdx2
-        
-        x1 = iatom.x
-        x2 = jatom.x
+    def check_bond(self, x1, x2, maxdx2, minbondlength2):
 
         dx = []
         for idim in range(self.dim):
@@ -537,20 +743,21 @@ class MOF(ATOM,LIBRARY):
             val += dx[idim]*dx[idim]
             if val > maxdx2:
                 del dx
+                if self.counters is not None:
+                    self.counters['rejects'][idim] += 1
                 return False
         
         del dx
         
-        minbondlength2 = (iatom.atr + jatom.atr)/2.0
-        minbondlength2 *= minbondlength2
-        
         if val < minbondlength2:
+            if self.counters is not None:
+                self.counters['overlaps'] += 1
             raise ValueError('Atom overlap detected')
             
         return True
 
     def get_distance(self, x1, x2):
-        """ Calculate the distance between two atoms, takes self.atom[index] as input, return distance in float"""
+        """ Calculate the distance between two atoms, takes two fractional coordinates as input, return distance in float"""
 
         dx = []
         for idim in range(self.dim):
@@ -571,78 +778,406 @@ class MOF(ATOM,LIBRARY):
             
     def check_repeat_atomlabel(self):
         
-        repeat = False
-        atomcount = len(self.atom)
+        labels = [self.get_atomlabel(iindex) for iindex in range(len(self.symbols))]
+        return len(set(labels)) != len(labels)
         
-        for atomcount1 in range(0, atomcount - 1):
-            label1 = self.atom[atomcount1].label
-            
-            for atomcount2 in range(atomcount1 + 1, atomcount):
-                label2 = self.atom[atomcount2].label
-                if label1 == label2:
-                    repeat = True
+    def get_neighborlist_without_grid(self):
         
-        return repeat         
+        x = self.frac.tolist()
+        symbols = self.symbols.tolist()
+        cutoff2 = self.lib.paircutoff2.tolist()
+        overlap2 = self.lib.pairoverlap2.tolist()
+        bonds = []
+        for iindex in range(len(x)):
+            for jindex in range(iindex + 1, len(x)):
+                si = symbols[iindex]
+                sj = symbols[jindex]
+                if self.check_bond(x[iindex], x[jindex], cutoff2[si][sj], overlap2[si][sj]) == True:
+                    bonds.append([iindex, jindex])
+        
+        distances = [self.get_distance(x[iindex], x[jindex]) for iindex, jindex in bonds]
+        bonds = np.array(bonds, dtype = np.int64).reshape(-1, 2)
+        self.set_bonds(bonds, self.get_minimage(bonds[:, 0], bonds[:, 1]), np.array(distances, dtype = np.float64))
+
+    def enable_counters(self):
+        
+        # method: neighbor search used, candidates: pairs tested for a bond,
+        # rejects: pairs rejected by the
+        # squared-distance test after 1, 2 or 3 dimensions, occupancy: number of
+        # grid cells holding 0, 1, 2, ... atoms
+        self.counters = {'method': None, 'candidates': 0, 'rejects': [0, 0, 0], 'bonds': 0, 'overlaps': 0,
+                         'ngrid': [], 'totgrid': 0, 'gridlx': [], 'occupancy': []}
+        
+    def update_gridcounters(self):
+        
+        self.counters['ngrid'] = list(self.ngrid)
+        self.counters['totgrid'] = self.totgrid
+        self.counters['gridlx'] = list(self.gridlx)
+        self.counters['occupancy'] = np.bincount([len(igrid) for igrid in self.gridatomlist]).tolist()
+    
+    def get_minimage(self, iindex, jindex):
         
-    def get_neighborlist_without_grid(self):
+        # lattice translation of the image of j nearest to i by the +-0.5
+        # fractional minimum image of check_bond
+        du = self.frac[iindex] - self.frac[jindex]
+        return (du > 0.5).astype(np.int64) - (du < -0.5).astype(np.int64)
+    
+    def check_bonds(self, iindex, jindex, nreject, image = None, x = None, symbols = None):
+        
+        # check_bond on arrays of pairs: mask of the pairs within the cutoff, their
+        # squared distances and the number of them that overlap. Without image
+        # the pairs are taken at the minimum image, computed like check_bond,
+        # otherwise at the image of j shifted by the lattice translation image.
+        # The Cartesian components are summed in the order of
+        # fractional_to_cartesian, so the same pairs pass as in check_bond.
+        # Rejects after 1, 2 or 3 dimensions are added to nreject. x and
+        # symbols default to the atom table, iindex and jindex index into them.
+        if x is None:
+            x = self.frac
+            symbols = self.symbols
+        h = self.h
+        du = x[iindex] - x[jindex]
+        if image is None:
+            du = np.where(du > 0.5, du - 1.0, du)
+            du = np.where(du < -0.5, du + 1.0, du)
+        else:
+            du = du - image
+        dx = [h[idim, 0] * du[:, 0] + h[idim, 1] * du[:, 1] + h[idim, 2] * du[:, 2] for idim in range(self.dim)]
+        del du
+        
+        si = symbols[iindex]
+        sj = symbols[jindex]
+        maxdx2 = self.lib.paircutoff2[si, sj]
+        d2 = dx[0] * dx[0]
+        rejected = d2 > maxdx2
+        nreject[0] += int(rejected.sum())
+        for idim in range(1, self.dim):
+            d2 = d2 + dx[idim] * dx[idim]
+            reject = d2 > maxdx2
+            nreject[idim] += int((reject & ~rejected).sum())
+            rejected = reject
+        del dx
         
-        self.G.clear()
-        self.G.add_nodes_from([i for i in range(len(self.atom))])
-            
-        for iatom in self.atom:
-            for jatom in self.atom:
-                if iatom.index < jatom.index:
-                    if self.check_bond(iatom,jatom) == True:
-                        iatom.add_neighbor(jatom.index)
-                        jatom.add_neighbor(iatom.index)
-                            
-                        if self.G.has_edge(iatom.index, jatom.index) == False:
-                            self.G.add_edge(iatom.index, jatom.index)
-
-    def get_neighborlist_with_grid(self):
+        bonded = ~rejected
+        d2 = d2[bonded]
+        noverlap = int((d2 < self.lib.pairoverlap2[si[bonded], sj[bonded]]).sum())
+        return bonded, d2, noverlap
+    
+    def get_gridstencil(self):
         
+        # cell offsets of neighgrid in its order (z, y, x from -1 to 1), offsets
+        # that wrap onto the same cell on axes with less than 3 cells left out
+        offsets = [[-1, 0, 1][:min(self.ngrid[idim], 3)] for idim in range(self.dim)]
+        return [[ix, iy, iz] for iz in offsets[2] for iy in offsets[1] for ix in offsets[0]]
+    
+    def get_gridcell(self):
+        
+        # grid cell of every atom as N x 3 integer coordinates
+        return np.stack([self.gridindex % self.ngrid[0],
+                         self.gridindex // self.ngrid[0] % self.ngrid[1],
+                         self.gridindex // (self.ngrid[0] * self.ngrid[1])], axis = 1)
+    
+    def order_bonds(self, iindex, jindex, image, distance):
+        
+        # E x 2 bond array, images and distances of the bonds, sorted into the
+        # order the per-atom loop over neighgrid and gridatomlist finds them: by
+        # i, then by the position of the cell of j in neighgrid of the cell of i
+        # (pairs outside the neighbor cells last), then by j and the image.
+        # Neighbor lists and graph built in this order give the same output for
+        # every search method.
+        cell = self.get_gridcell()
+        diff = (cell[jindex] - cell[iindex]) % self.ngrid
+        stencil = np.zeros(len(iindex), dtype = np.int64)
+        outside = np.zeros(len(iindex), dtype = bool)
+        for idim in reversed(range(self.dim)):
+            offsets = [-1, 0, 1][:min(self.ngrid[idim], 3)]
+            position = np.full(len(iindex), -1)
+            for ioffset in reversed(range(len(offsets))):
+                position[diff[:, idim] == offsets[ioffset] % self.ngrid[idim]] = ioffset
+            outside |= position < 0
+            stencil = stencil * len(offsets) + position
+        stencil[outside] = len(self.get_gridstencil())
+        
+        bondorder = np.lexsort((image[:, 2], image[:, 1], image[:, 0], jindex, stencil, iindex))
+        bonds = np.stack([iindex[bondorder], jindex[bondorder]], axis = 1).astype(np.int64)
+        return bonds, image[bondorder].astype(np.int64), distance[bondorder]
+    
+    def get_halfstencil(self):
+        
+        # the offsets of get_gridstencil that visit every pair of neighbor cells
+        # once: of an offset and its opposite only the one with the first
+        # nonzero component (z, y, x) positive is kept. An offset that wraps
+        # onto its own opposite (zero, or any offset on axes with 1 or 2
+        # cells) is kept with a flag, it meets each pair of atoms from both
+        # cells and only one of the two is tested.
+        halfstencil = []
+        for offset in self.get_gridstencil():
+            opposite = [-offset[idim] if self.ngrid[idim] >= 3 else offset[idim] for idim in range(self.dim)]
+            if opposite == offset:
+                halfstencil.append([offset, True])
+            elif offset[::-1] > opposite[::-1]:
+                halfstencil.append([offset, False])
+        return halfstencil
+    
+    def get_mortoncode(self, cell):
+        
+        # Z-order code of integer cell coordinates, bits of x, y and z interleaved
+        code = np.zeros(len(cell), dtype = np.int64)
+        for bit in range(21):
+            for idim in range(self.dim):
+                code |= ((cell[:, idim] >> bit) & 1) << (self.dim * bit + idim)
+        return code
+    
+    def get_bonds_with_grid(self):
+        
+        # All bonds of the grid search as an E x 2 array, their images and
+        # distances. The atoms are sorted into Z-order of their cells, so every
+        # cell is a contiguous slice of the sorted coordinates; mof.cellorder
+        # maps a sorted position back to the atom table. The 13 + 1 offsets of
+        # the half stencil pair each cell with its neighbor cells once, the
+        # candidates of one offset are expanded for a block of atoms at a time
+        # and tested as arrays by check_bonds.
+        natom = len(self.symbols)
+        cell = self.get_gridcell()
+        code = self.get_mortoncode(cell)
+        order = np.argsort(code, kind = 'stable')
+        self.cellorder = order
+        x = self.frac[order]
+        symbols = self.symbols[order]
+        cell = cell[order]
+        
+        # first sorted position and number of atoms of every grid cell
+        igrid = np.arange(self.totgrid)
+        gridcode = self.get_mortoncode(np.stack([igrid % self.ngrid[0], igrid // self.ngrid[0] % self.ngrid[1],
+                                                 igrid // (self.ngrid[0] * self.ngrid[1])], axis = 1))
+        sortedcode = code[order]
+        cellfirst = np.searchsorted(sortedcode, gridcode, side = 'left')
+        cellcount = np.searchsorted(sortedcode, gridcode, side = 'right') - cellfirst
+        
+        ncandidate = 0
+        nreject = [0, 0, 0]
+        noverlap = 0
+        bonds = []
+        try:
+            for offset, selfopposite in self.get_halfstencil():
+                neigh = (cell + offset) % self.ngrid
+                neigh = neigh[:, 0] + self.ngrid[0] * neigh[:, 1] + self.ngrid[0] * self.ngrid[1] * neigh[:, 2]
+                first = cellfirst[neigh]
+                count = cellcount[neigh]
+                total = np.cumsum(count)
+                
+                iatom = 0
+                while iatom < natom:
+                    # atoms iatom..jatom-1 expand to at most pairblock candidates
+                    done = total[iatom - 1] if iatom > 0 else 0
+                    jatom = max(int(np.searchsorted(total, done + self.lib.pairblock, side = 'right')), iatom + 1)
+                    blockcount = count[iatom:jatom]
+                    ipos = np.repeat(np.arange(iatom, jatom), blockcount)
+                    position = np.arange(len(ipos)) - np.repeat(np.cumsum(blockcount) - blockcount, blockcount)
+                    jpos = np.repeat(first[iatom:jatom], blockcount) + position
+                    iatom = jatom
+                    
+                    if selfopposite:
+                        keep = ipos < jpos
+                        ipos = ipos[keep]
+                        jpos = jpos[keep]
+                    
+                    # test every pair as i < j in the atom table, like check_bond
+                    swap = order[ipos] > order[jpos]
+                    ipos, jpos = np.where(swap, jpos, ipos), np.where(swap, ipos, jpos)
+                    ncandidate += len(ipos)
+                    
+                    bonded, d2, noverlap = self.check_bonds(ipos, jpos, nreject, x = x, symbols = symbols)
+                    if noverlap > 0:
+                        raise ValueError('Atom overlap detected')
+                    iindex = order[ipos[bonded]]
+                    jindex = order[jpos[bonded]]
+                    bonds.append([iindex, jindex, self.get_minimage(iindex, jindex), np.sqrt(d2)])
+        finally:
+            if self.counters is not None:
+                self.counters['candidates'] += ncandidate
+                for idim in range(self.dim):
+                    self.counters['rejects'][idim] += nreject[idim]
+                self.counters['bonds'] += sum(len(ibond[0]) for ibond in bonds)
+                self.counters['overlaps'] += noverlap
+        
+        if len(bonds) == 0:
+            return self.order_bonds(np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64), np.zeros((0, 3), dtype = np.int64), np.zeros(0))
+        return self.order_bonds(*[np.concatenate([ibond[i] for ibond in bonds]) for i in range(4)])
+    
+    def get_imagerange(self, cutoff):
+        
+        # perpendicular widths of the cell and, per axis, the fractional margin
+        # cutoff/width and the largest lattice translation reaching an atom
+        # within cutoff of the cell
+        h = self.h
+        volume = abs(np.linalg.det(h))
+        width = np.array([volume / np.linalg.norm(np.cross(h[:, (idim + 1) % 3], h[:, (idim + 2) % 3])) for idim in range(self.dim)])
+        margin = cutoff / width
+        return width, margin, np.floor(1.0 + margin).astype(int)
+    
+    def get_bonds_with_kdtree(self):
+        
+        # The bonds of every periodic image within the cutoff, from a KD-tree
+        # over the Cartesian positions of the atoms in the cell. The tree is
+        # queried with the atoms shifted by each lattice translation that can
+        # reach the cell, those within the largest cutoff of it, so an atom
+        # bonded to several images of j, or to an image of itself, in a cell
+        # thinner than the cutoff gets one bond per image. Each (pair, image) is
+        # tested by check_bonds; where the minimum image is the only one in
+        # range this is the test of the grid.
+        natom = len(self.symbols)
+        h = self.h
+        elements = np.unique(self.symbols)
+        cutoff = float(np.sqrt(self.lib.paircutoff2[np.ix_(elements, elements)].max())) * (1.0 + 1e-6) if natom > 0 else 0.0
+        width, margin, nimage = self.get_imagerange(cutoff)
+        tree = KDTREE(self.frac @ h.T, self.lib.kdtreeleafsize)
+        
+        iindex = []
+        jindex = []
+        image = []
+        for ix in range(-nimage[0], nimage[0] + 1):
+            for iy in range(-nimage[1], nimage[1] + 1):
+                for iz in range(-nimage[2], nimage[2] + 1):
+                    # i shifted by t next to j is i next to j shifted by -t;
+                    # bonds of i to its own images are kept once, for the
+                    # translation with the first nonzero component negative
+                    translation = np.array([ix, iy, iz])
+                    x = self.frac + translation
+                    shifted = np.flatnonzero(((x >= -margin) & (x <= 1.0 + margin)).all(axis = 1))
+                    query, point = tree.query_pairs(x[shifted] @ h.T, cutoff)
+                    query = shifted[query]
+                    negative = translation[np.flatnonzero(translation)[0]] < 0 if translation.any() else False
+                    keep = (query < point) | ((query == point) & negative)
+                    iindex.append(query[keep])
+                    jindex.append(point[keep])
+                    image.append(np.tile(-translation, (int(keep.sum()), 1)))
+        iindex = np.concatenate(iindex)
+        jindex = np.concatenate(jindex)
+        image = np.concatenate(image)
+        
+        nreject = [0, 0, 0]
+        noverlap = 0
+        nbond = 0
+        try:
+            bonded, d2, noverlap = self.check_bonds(iindex, jindex, nreject, image)
+            if noverlap > 0:
+                raise ValueError('Atom overlap detected')
+            nbond = len(d2)
+        finally:
+            if self.counters is not None:
+                self.counters['candidates'] += len(iindex)
+                for idim in range(self.dim):
+                    self.counters['rejects'][idim] += nreject[idim]
+                self.counters['bonds'] += nbond
+                self.counters['overlaps'] += noverlap
+        
+        return self.order_bonds(iindex[bonded], jindex[bonded], image[bonded], np.sqrt(d2))
+    
+    def get_neighbormethod(self):
+        
+        # grid or kdtree from the cell shape and the atom density. The grid sizes
+        # its cells from the Cartesian component of the cell vectors, so on
+        # oblique axes with 3 or more cells a cell can be thinner than the cutoff
+        # and the stencil misses pairs. Otherwise the grid tests the atoms of its
+        # block of stencil cells, which only pays off while that block is not
+        # much larger than the cutoff sphere.
+        width, margin, nimage = self.get_imagerange(self.gridlxmax)
+        for idim in range(self.dim):
+            if self.ngrid[idim] >= 3 and width[idim] / self.ngrid[idim] < self.gridlxmax:
+                return 'kdtree'
+            
+        # a cell less than twice the cutoff wide can hold bonds to an image other
+        # than the +-0.5 minimum image the grid tests, or to several images
+        if (width < 2.0 * self.gridlxmax).any():
+            return 'kdtree'
+        
+        volume = abs(np.linalg.det(self.h))
+        density = len(self.symbols) / volume
+        gridpairs = density * len(self.get_gridstencil()) * volume / self.totgrid
+        treepairs = density * 4.0 / 3.0 * np.pi * self.gridlxmax ** 3
+        if gridpairs > self.lib.kdtreeminpairs and gridpairs > self.lib.kdtreeratio * treepairs:
+            return 'kdtree'
+        return 'grid'
+    
+    def set_bonds(self, bonds, images, distances):
+        
+        # neighbor lists and graph edges from the bond table, in its order; a
+        # pair bonded through several images is one neighbor, a bond to an image
+        # of the atom itself is not a neighbor
+        self.bonds = bonds
+        self.bondimage = images
+        self.bonddistance = distances
         self.G.clear()
-        self.G.add_nodes_from([i for i in range(len(self.atom))])
-        
-        for iatom in self.atom:
-            for igrid in self.neighgrid[iatom.gridindex]:
-                for jindex in self.gridatomlist[igrid]:
-                    if iatom.index < jindex:
-                        jatom = self.atom[jindex]
-                        if self.check_bond(iatom,jatom) == True:
-                            iatom.add_neighbor(jatom.index)
-                            jatom.add_neighbor(iatom.index)
-                            
-                            if self.G.has_edge(iatom.index, jatom.index) == False:
-                                self.G.add_edge(iatom.index, jatom.index)
+        self.G.add_nodes_from([i for i in range(len(self.symbols))])
+        self.clear_neighborlist()
+        pairs = []
+        for iindex, jindex in bonds.tolist():
+            if iindex == jindex or (pairs and pairs[-1] == [iindex, jindex]):
+                continue
+            pairs.append([iindex, jindex])
+            self.neighborlist[iindex].append(jindex)
+            self.neighborlist[jindex].append(iindex)
+        self.nbond = len(pairs)
+        self.G.add_edges_from(pairs)
+    
+    def get_neighborlist_with_grid(self, method = 'grid'):
         
-    def get_neighborlist(self, grid):
+        if method == 'auto':
+            method = self.get_neighbormethod()
+        if self.counters is not None:
+            self.counters['method'] = method
+            
+        try:
+            if method == 'grid':
+                bonds, images, distances = self.get_bonds_with_grid()
+            elif method == 'kdtree':
+                bonds, images, distances = self.get_bonds_with_kdtree()
+            else:
+                raise ValueError(f'Unknown neighbor search method {method}')
+        finally:
+            if self.counters is not None:
+                self.update_gridcounters()
+        self.set_bonds(bonds, images, distances)
         
+    def get_neighborlist(self, grid = True, method = 'grid'):
+        
+        # method: 'grid', 'kdtree' or 'auto' to choose from the cell, all need
+        # get_atomgridinfo first; grid = False tests all pairs
         if grid:
-            self.get_neighborlist_with_grid()
+            self.get_neighborlist_with_grid(method)
         else:
             self.get_neighborlist_without_grid()
         
     def clear_neighborlist(self):
         
-        for iatom in self.atom:
-            for ineighbor in iatom.neighborlist:
-                iatom.remove_neighbor(ineighbor)
+        self.neighborlist = [[] for iindex in range(len(self.symbols))]
+        self.nbond = 0
+        
+    def add_neighbor(self, iindex, jindex):
+        
+        if jindex not in self.neighborlist[iindex]:
+            self.neighborlist[iindex].append(jindex)
+            self.nbond += 1
+        if iindex not in self.neighborlist[jindex]:
+            self.neighborlist[jindex].append(iindex)
                 
     def remove_neighbor(self, iindex, jindex):
         
-        self.atom[iindex].remove_neighbor(jindex)
-        self.atom[jindex].remove_neighbor(iindex)
+        if jindex in self.neighborlist[iindex]:
+            self.nbond -= 1
+        self.neighborlist[iindex] = [ineighbor for ineighbor in self.neighborlist[iindex] if ineighbor != jindex]
+        self.neighborlist[jindex] = [ineighbor for ineighbor in self.neighborlist[jindex] if ineighbor != iindex]
         
     def get_graph(self):
         
         self.G.clear()
-        self.G.add_nodes_from([i for i in range(len(self.atom))])
+        self.G.add_nodes_from([i for i in range(len(self.symbols))])
         
-        for iatom in self.atom:
-            for ineighbor in iatom.neighborlist:
-                if self.G.has_edge(iatom.index, ineighbor) == False:
-                    self.G.add_edge(iatom.index, ineighbor)
+        for iindex, neighborlist in enumerate(self.neighborlist):
+            for ineighbor in neighborlist:
+                if self.G.has_edge(iindex, ineighbor) == False:
+                    self.G.add_edge(iindex, ineighbor)
             
     def get_solvent(self):
         
@@ -651,7 +1186,7 @@ class MOF(ATOM,LIBRARY):
         for ifragment in fragmentlist:
             metal = False
             for iindex in ifragment:
-                if self.atom[iindex].ismetal:
+                if self.ismetal[iindex]:
                     metal = True
                     break
                     
@@ -665,8 +1200,8 @@ class MOF(ATOM,LIBRARY):
                 
     def check_multimetal(self, iindex, imetalindex):
     
-        for ineighbor in self.atom[iindex].neighborlist:
-            if self.atom[ineighbor].ismetal == True:
+        for ineighbor in self.neighborlist[iindex]:
+            if self.ismetal[ineighbor] == True:
                 if ineighbor != imetalindex:
                     return True
 
@@ -679,15 +1214,15 @@ class MOF(ATOM,LIBRARY):
         #get capairlist
         for imetaltype in self.metaltypelist:
             for imetalindex in imetaltype[1]:
-                for ineighbor in self.atom[imetalindex].neighborlist:
-                    if self.atom[ineighbor].ismetal == False:
+                for ineighbor in self.neighborlist[imetalindex]:
+                    if self.ismetal[ineighbor] == False:
                         count = 0
-                        for jneighbor in self.atom[ineighbor].neighborlist:
-                            if self.atom[jneighbor].ismetal == True:
+                        for jneighbor in self.neighborlist[ineighbor]:
+                            if self.ismetal[jneighbor] == True:
                                 count += 1
-                            elif self.atom[jneighbor].symbol == 'H':
+                            elif self.get_symbol(jneighbor) == 'H':
                                 count += 1
-                        if count != len(self.atom[ineighbor].neighborlist):
+                        if count != len(self.neighborlist[ineighbor]):
                             self.capairlist.append([imetalindex, ineighbor])
         self.fragG = self.G.copy()
 
@@ -707,7 +1242,7 @@ class MOF(ATOM,LIBRARY):
             found = False
             count = 0
             for iindex in ifragment:
-                if self.atom[iindex].ismetal:
+                if self.ismetal[iindex]:
                     found = True
 
                 if found:
@@ -752,25 +1287,25 @@ class MOF(ATOM,LIBRARY):
             capairlist = []
             removecalist = []
             for k, ica in enumerate(calist):
-                for ineighbor in self.atom[ica].neighborlist:
+                for ineighbor in self.neighborlist[ica]:
                     for jca in calist[k+1:]:
-                        for jneighbor in self.atom[jca].neighborlist:
+                        for jneighbor in self.neighborlist[jca]:
                             if ineighbor == jneighbor:
                                 if ineighbor not in imetalnode:
                                     update = True
-                                    for kneighbor in self.atom[ica].neighborlist:
+                                    for kneighbor in self.neighborlist[ica]:
                                         if kneighbor not in imetalnode:
                                             if kneighbor != ineighbor:
-                                                if self.atom[kneighbor].symbol != 'H':
+                                                if self.get_symbol(kneighbor) != 'H':
                                                     update = False
-                                    for kneighbor in self.atom[jca].neighborlist:
+                                    for kneighbor in self.neighborlist[jca]:
                                         if kneighbor not in imetalnode:
                                             if kneighbor != ineighbor:
-                                                if self.atom[kneighbor].symbol != 'H':
+                                                if self.get_symbol(kneighbor) != 'H':
                                                     update = False
                                     
                                     if update:
-                                        for kneighbor in self.atom[jneighbor].neighborlist:
+                                        for kneighbor in self.neighborlist[jneighbor]:
                                             if kneighbor not in allcalist:
                                                 if kneighbor not in imetalnode:
                                                     capairlist.append([jneighbor,kneighbor])
@@ -806,7 +1341,7 @@ class MOF(ATOM,LIBRARY):
         for ifragment in fragmentlist:
             metal = False
             for iindex in ifragment:
-                if self.atom[iindex].ismetal:
+                if self.ismetal[iindex]:
                     metal = True
                     break
 
@@ -849,8 +1384,8 @@ class MOF(ATOM,LIBRARY):
         fragmentatomtypelist = []
         fragmentatomtypelist = self.destroy(fragmentatomtypelist)
         for iindex in fragment:
-            if self.atom[iindex].symbol not in fragmentatomtypelist:
-                fragmentatomtypelist.append(self.atom[iindex].symbol)
+            if self.get_symbol(iindex) not in fragmentatomtypelist:
+                fragmentatomtypelist.append(self.get_symbol(iindex))
         fragmentatomtypelist.sort()
         
         fragmentatomtypecountlist = []
@@ -861,7 +1396,7 @@ class MOF(ATOM,LIBRARY):
         for iindex in fragment:
             count = 0
             for fragmentatomtype in fragmentatomtypelist:
-                if fragmentatomtype != self.atom[iindex].symbol:
+                if fragmentatomtype != self.get_symbol(iindex):
                     count += 1
                 else:
                     break
@@ -930,9 +1465,8 @@ class MOF(ATOM,LIBRARY):
     
     def wrap_fragment(self, fragment):
         
-        for iindex in fragment:
-            for idim in range(self.dim):
-                self.atom[iindex].writex[idim] = self.atom[iindex].x[idim]
+        self.wrapped[fragment] = self.frac[fragment]
+        writex = self.wrapped
                 
         atomshift = []
         for i, iindex in enumerate(fragment):
@@ -942,18 +1476,16 @@ class MOF(ATOM,LIBRARY):
         while done == False:
             shift = False
             for iindex in fragment:
-                iatom = self.atom[iindex]
-                for jindex in iatom.neighborlist:
+                for jindex in self.neighborlist[iindex]:
                     if iindex > jindex:
-                        jatom = self.atom[jindex]
                         for idim in range(self.dim):
-                            val = abs(iatom.writex[idim] - jatom.writex[idim])
+                            val = abs(writex[iindex, idim] - writex[jindex, idim])
                             if val > 0.5:
-                                if iatom.writex[idim] > jatom.writex[idim]:
+                                if writex[iindex, idim] > writex[jindex, idim]:
                                     for i, dim in atomshift:
                                         if i == iindex:
                                             if dim[idim] == False:
-                                                iatom.writex[idim] -= 1.0
+                                                writex[iindex, idim] -= 1.0
                                                 shift = True
                                                 dim[idim] = True
                                                 break
@@ -961,7 +1493,7 @@ class MOF(ATOM,LIBRARY):
                                     for i, dim in atomshift:
                                         if i == jindex:
                                             if dim[idim] == False:
-                                                jatom.writex[idim] -= 1.0
+                                                writex[jindex, idim] -= 1.0
                                                 shift = True
                                                 dim[idim] = True
                                                 break
@@ -1003,14 +1535,14 @@ class MOF(ATOM,LIBRARY):
                 if status == False:
                     if iindex == jnode:
                         status = True
-                        label = self.update_label(self.atom[iindex].label)
+                        label = self.update_label(self.get_atomlabel(iindex))
             return status, label
         elif case == 1:
             for inode, jnode in self.compcapairlist:
                 if status == False:
                     if iindex == inode:
                         status = True
-                        label = self.update_label(self.atom[iindex].label)
+                        label = self.update_label(self.get_atomlabel(iindex))
             return status, label
         else:
             return status, label
@@ -1022,14 +1554,13 @@ class MOF(ATOM,LIBRARY):
         f.write("%-4d\n\n" %len(fragment))
     
         for iindex in fragment:
-            iatom = self.atom[iindex]
             status, label = self.get_label(iindex, case)
             if status:
                 f.write('Ar')
             else:
-                f.write(iatom.symbol)
+                f.write(self.get_symbol(iindex))
                 
-            xc = self.fractional_to_cartesian(iatom.writex)    
+            xc = self.fractional_to_cartesian(self.wrapped[iindex])    
             for idim in range(self.dim):
                 f.write('\t%-10.6f' %xc[idim])
             f.write('\n')
@@ -1072,20 +1603,19 @@ class MOF(ATOM,LIBRARY):
         f.write('_atom_site_charge\n')
 
         for iindex in fragment:
-            iatom = self.atom[iindex]
             status, label = self.get_label(iindex, case)
 
             if status:
                 f.write(label)
             else:
-                f.write(iatom.label)
+                f.write(self.get_atomlabel(iindex))
             f.write('\t')
             if status:
                 f.write('Ar')
             else:
-                f.write(iatom.symbol)
+                f.write(self.get_symbol(iindex))
             for idim in range(self.dim):
-                f.write('\t%-10.6f' %iatom.writex[idim])
+                f.write('\t%-10.6f' %self.wrapped[iindex, idim])
             f.write('\t0.00000\tUsio\t1.00\t0.00\n')
         f.write('loop_\n')
         f.write('_geom_bond_atom_site_label_1\n')
@@ -1098,101 +1628,1822 @@ class MOF(ATOM,LIBRARY):
         for iindex in fragment:
             status1, label = self.get_label(iindex, case)
             if status1 == False:
-                for ineighbor in self.atom[iindex].neighborlist:
+                for ineighbor in self.neighborlist[iindex]:
                     if iindex > ineighbor:
                         ibondpair = [ineighbor, iindex]
                     else:
                         ibondpair = [iindex, ineighbor]
                     if ibondpair not in bondpairlist:
-                        bondlength = self.get_distance(self.atom[iindex].writex,self.atom[ineighbor].writex)
-                        f.write(self.atom[iindex].label)
+                        bondlength = self.get_distance(self.wrapped[iindex],self.wrapped[ineighbor])
+                        f.write(self.get_atomlabel(iindex))
                         f.write('\t')
                         status2, label = self.get_label(ineighbor, case)
                         if status2:
                             f.write(label)
                         else:
-                            f.write(self.atom[ineighbor].label)
+                            f.write(self.get_atomlabel(ineighbor))
                         f.write('\t%-10.6f\t.\tS\n' %bondlength)
                         bondpairlist.append(ibondpair)
         del bondpairlist
         f.close()
+        
+    def get_fragment_arrays(self, fragment, case):
+        
+        # the content of write_xyz and write_cif as arrays, for the pack output
+        fragment = self.wrap_fragment(fragment)
+        
+        symbol = []
+        label = []
+        frac = []
+        xyz = []
+        for iindex in fragment:
+            status, xlabel = self.get_label(iindex, case)
+            if status:
+                symbol.append('Ar')
+                label.append(xlabel)
+            else:
+                symbol.append(self.get_symbol(iindex))
+                label.append(self.get_atomlabel(iindex))
+            frac.append(self.wrapped[iindex].tolist())
+            xyz.append(self.fractional_to_cartesian(self.wrapped[iindex]))
+            
+        bondlabel = []
+        bonddistance = []
+        bondpairlist = []
+        for iindex in fragment:
+            status1, xlabel = self.get_label(iindex, case)
+            if status1 == False:
+                for ineighbor in self.neighborlist[iindex]:
+                    if iindex > ineighbor:
+                        ibondpair = [ineighbor, iindex]
+                    else:
+                        ibondpair = [iindex, ineighbor]
+                    if ibondpair not in bondpairlist:
+                        status2, xlabel = self.get_label(ineighbor, case)
+                        if status2 == False:
+                            xlabel = self.get_atomlabel(ineighbor)
+                        bondlabel.append([self.get_atomlabel(iindex), xlabel])
+                        bonddistance.append(self.get_distance(self.wrapped[iindex],self.wrapped[ineighbor]))
+                        bondpairlist.append(ibondpair)
+        del bondpairlist
+        
+        return {'xyz': np.array(xyz, dtype = np.float64).reshape(-1, 3),
+                'frac': np.array(frac, dtype = np.float64).reshape(-1, 3),
+                'bonddistance': np.array(bonddistance, dtype = np.float64),
+                'symbol': np.array(symbol, dtype = 'S2'),
+                'label': np.array(label, dtype = 'S16'),
+                'bondlabel': np.array(bondlabel, dtype = 'S16').reshape(-1, 2),
+                'ciffile': self.ciffile,
+                'lx': list(self.lx),
+                'angles': [iar/self.lib.a2r for iar in self.ar]}
     
     
 
-def MOFdecompose(cif2cell, inputcif, outputdir):
+def import_cif2cell(cif2cell):
     
+    # cif2cell imports its helpers (utils, uctools, ...) from its own directory
+    cifutilsdir = os.path.dirname(os.path.abspath(cif2cell))
+    if cifutilsdir not in sys.path:
+        sys.path.insert(0, cifutilsdir)
+        
+    return importlib.import_module(Path(cif2cell).stem)
+
+class PACK:
+    
+    # One pack file of fixed-layout float64/bytes arrays per building block plus
+    # a JSONL index (MOF name, kind, ordinal, offset, length). Arrays are stored
+    # in this order, each fragment padded to 8 bytes.
+    layout = [['xyz', np.float64, 3], ['frac', np.float64, 3], ['bonddistance', np.float64, 0],
+              ['symbol', 'S2', 0], ['label', 'S16', 0], ['bondlabel', 'S16', 2]]
+    
+    def __init__ (self, packfile):
+        
+        self.packfile = packfile
+        self.indexfile = os.path.splitext(packfile)[0] + '.index.jsonl'
+        self.index = []
+        self.mm = None
+        
+    def create(self):
+        open(self.packfile,'wb').close()
+        open(self.indexfile,'w').close()
+        
+    def keep(self, MOFnames):
+        
+        # drop the index entries of MOFs not in MOFnames, such as fragments
+        # appended before a crash kept the manifest record from being written,
+        # and cut the pack file after the last fragment left
+        self.open()
+        self.close()
+        index = [record for record in self.index if record['mof'] in MOFnames]
+        end = 0
+        for record in index:
+            end = max(end, record['offset'] + record['length'] + (-record['length'] % 8))
+        
+        f = open(self.indexfile,'w')
+        for record in index:
+            f.write(json.dumps(record) + '\n')
+        f.close()
+        f = open(self.packfile,'r+b')
+        f.truncate(min(end, os.path.getsize(self.packfile)))
+        f.close()
+        
+        ndrop = len(self.index) - len(index)
+        self.index = index
+        return ndrop
+        
+    def append(self, MOFname, fragments):
+        
+        fpack = open(self.packfile,'ab')
+        findex = open(self.indexfile,'a')
+        for kind, ordinal, arrays in fragments:
+            offset = fpack.tell()
+            for name, dtype, ncol in self.layout:
+                fpack.write(np.ascontiguousarray(arrays[name], dtype = dtype).tobytes())
+            length = fpack.tell() - offset
+            fpack.write(b'\0' * (-length % 8))
+            
+            record = {'mof': MOFname, 'kind': kind, 'ordinal': ordinal, 'offset': offset, 'length': length,
+                      'natom': len(arrays['symbol']), 'nbond': len(arrays['bonddistance']),
+                      'ciffile': arrays['ciffile'], 'lx': arrays['lx'], 'angles': arrays['angles']}
+            findex.write(json.dumps(record) + '\n')
+        fpack.close()
+        findex.close()
+        
+    def open(self):
+        
+        self.index = self.destroy(self.index)
+        f = open(self.indexfile,'r')
+        for line in f:
+            try:
+                self.index.append(json.loads(line))
+            except ValueError:
+                continue
+        f.close()
+        
+        f = open(self.packfile,'rb')
+        if os.path.getsize(self.packfile) > 0:
+            self.mm = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        f.close()
+        return self.index
+    
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
+            
+    def destroy(self, array):
+        del array
+        array = []
+        return array
+        
+    def find(self, MOFname, kind, ordinal):
+        for record in self.index:
+            if record['mof'] == MOFname and record['kind'] == kind and record['ordinal'] == ordinal:
+                return record
+        return None
+        
+    def read(self, record):
+        
+        # zero-copy views into the memory-mapped pack file
+        arrays = {}
+        offset = record['offset']
+        for name, dtype, ncol in self.layout:
+            if name in ['bonddistance', 'bondlabel']:
+                nrow = record['nbond']
+            else:
+                nrow = record['natom']
+            count = nrow * max(ncol, 1)
+            array = np.frombuffer(self.mm, dtype = dtype, count = count, offset = offset)
+            if ncol > 0:
+                array = array.reshape(nrow, ncol)
+            arrays[name] = array
+            offset += array.nbytes
+        return arrays
+    
+    def write_xyz(self, record, xyzfile):
+        
+        arrays = self.read(record)
+        f = open(xyzfile,'w')
+        f.write("%-4d\n\n" %record['natom'])
+        for i in range(record['natom']):
+            f.write(arrays['symbol'][i].decode())
+            for idim in range(3):
+                f.write('\t%-10.6f' %arrays['xyz'][i][idim])
+            f.write('\n')
+        f.close()
+        
+    def write_cif(self, record, ciffile):
+        
+        arrays = self.read(record)
+        f = open(ciffile,'w')
+        f.write(record['ciffile'] + '\n')
+        today = datetime.date.today()
+        date = today.strftime("%Y-%m-%d")
+        f.write('_audit_creation_date\t\t\t%s\n' %date)
+        f.write('_audit_creation_method\t\t\t\'mfg\'\n')
+        f.write('_symmetry_space_group_name_H-M\t\t\'P1\'\n')
+        f.write('_symmetry_Int_Tables_number\t\t1\n')
+        f.write('_symmetry_cell_setting\t\t\ttriclinic\n')
+        f.write('loop_\n')
+        f.write('_symmetry_equiv_pos_as_xyz\n')
+        f.write('\tx,y,z\n')
+        f.write('_cell_length_a\t\t\t\t%-10.6f\n' %record['lx'][0])
+        f.write('_cell_length_b\t\t\t\t%-10.6f\n' %record['lx'][1])
+        f.write('_cell_length_c\t\t\t\t%-10.6f\n' %record['lx'][2])
+        f.write('_cell_angle_alpha\t\t\t%-10.6f\n' %record['angles'][0])
+        f.write('_cell_angle_beta\t\t\t%-10.6f\n' %record['angles'][1])
+        f.write('_cell_angle_gamma\t\t\t%-10.6f\n' %record['angles'][2])
+        f.write('loop_\n')
+        f.write('_atom_site_label\n')
+        f.write('_atom_site_type_symbol\n')
+        f.write('_atom_site_fract_x\n')
+        f.write('_atom_site_fract_y\n')
+        f.write('_atom_site_fract_z\n')
+        f.write('_atom_site_U_iso_or_equiv\n')
+        f.write('_atom_site_adp_type\n')
+        f.write('_atom_site_occupancy\n')
+        f.write('_atom_site_charge\n')
+        for i in range(record['natom']):
+            f.write(arrays['label'][i].decode())
+            f.write('\t')
+            f.write(arrays['symbol'][i].decode())
+            for idim in range(3):
+                f.write('\t%-10.6f' %arrays['frac'][i][idim])
+            f.write('\t0.00000\tUsio\t1.00\t0.00\n')
+        f.write('loop_\n')
+        f.write('_geom_bond_atom_site_label_1\n')
+        f.write('_geom_bond_atom_site_label_2\n')
+        f.write('_geom_bond_distance\n')
+        f.write('_geom_bond_site_symmetry_2\n')
+        f.write('_ccdc_bond_type\n')
+        for i in range(record['nbond']):
+            f.write(arrays['bondlabel'][i][0].decode())
+            f.write('\t')
+            f.write(arrays['bondlabel'][i][1].decode())
+            f.write('\t%-10.6f\t.\tS\n' %arrays['bonddistance'][i])
+        f.close()
+
+class STAGES:
+    
+    # Times the pipeline stages of one MOF, used as "with stages('name'):".
+    # After an exception the stage it was raised in stays in self.stage.
+    # With profile, CPU time and the atom, bond and fragment counts of self.mof
+    # after each stage are recorded as well.
+    def __init__ (self, report = None, profile = False):
+        
+        self.report = report
+        self.profile = profile
+        self.stage = ''
+        self.elapsed = {}
+        self.natom = 0
+        self.start = 0.0
+        self.cpustart = 0.0
+        self.records = {}
+        self.mof = None
+        # error of cif2cell when the raw CIF was read instead
+        self.fallback = ''
+        
+    def __call__(self, stage):
+        self.stage = stage
+        return self
+        
+    def __enter__(self):
+        if self.report is not None:
+            self.report(self)
+        if self.profile:
+            self.cpustart = time.process_time()
+        self.start = time.perf_counter()
+        return self
+    
+    def __exit__(self, exctype, exc, tb):
+        wall = time.perf_counter() - self.start
+        self.elapsed[self.stage] = self.elapsed.get(self.stage, 0.0) + wall
+        if self.profile:
+            self.add_record(wall, time.process_time() - self.cpustart)
+        if exctype is None:
+            self.stage = ''
+        return False
+    
+    def add_record(self, wall, cpu):
+        
+        record = self.records.setdefault(self.stage, {'calls': 0, 'wall': 0.0, 'cpu': 0.0})
+        record['calls'] += 1
+        record['wall'] += wall
+        record['cpu'] += cpu
+        if self.mof is not None:
+            record['natom'] = len(self.mof.atom)
+            record['nbond'] = self.mof.nbond
+            record['nfragment'] = len(self.mof.metalnodelist) + len(self.mof.linkerlist) + len(self.mof.solventlist)
+
+def profile_summary(profiles):
+    
+    # p50/p95/max of the wall and CPU time of each stage over all profiled MOFs
+    stagetimes = {}
+    for profile in profiles:
+        for stage, record in profile.items():
+            times = stagetimes.setdefault(stage, {'wall': [], 'cpu': []})
+            times['wall'].append(record['wall'])
+            times['cpu'].append(record['cpu'])
+    
+    summary = {}
+    for stage, times in stagetimes.items():
+        summary[stage] = {'n': len(times['wall'])}
+        for key in ['wall', 'cpu']:
+            array = np.array(times[key])
+            summary[stage][key] = {'p50': float(np.percentile(array, 50)), 'p95': float(np.percentile(array, 95)),
+                                   'max': float(array.max()), 'total': float(array.sum())}
+    return summary
+
+def reset_peak_rss():
+    
+    # start a new peak for the next task: Linux sets VmHWM back to the current
+    # resident set size when 5 is written to clear_refs
+    try:
+        f = open('/proc/self/clear_refs','w')
+        f.write('5')
+        f.close()
+    except OSError:
+        pass
+
+def peak_rss():
+    
+    # peak resident set size in MB since reset_peak_rss, the peak of the whole
+    # process where /proc is not available
+    try:
+        f = open('/proc/self/status','r')
+        lines = f.readlines()
+        f.close()
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+    
+    for line in lines:
+        list = line.split()
+        if len(list) > 1 and list[0] == 'VmHWM:':
+            return float(list[1]) / 1024.0
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+# bytes of an atom loop converted at a time, bounds the temporary token lists
+CIF_CHUNK = 1 << 20
+
+# start of the line that ends a loop body: a tag, another loop, block or text field
+CIF_LOOPEND = re.compile(rb'^[ \t]*(?:_|;|(?i:loop_|data_|global_|save_))', re.M)
+
+def cif_numbers(column):
+    
+    # NumPy floats of a column of CIF numbers, "1.234(5)" uncertainties removed
+    try:
+        return column.astype(np.float64)
+    except ValueError:
+        return np.char.partition(column, b'(')[:, 0].astype(np.float64)
+
+def cif_tokens(line):
+    
+    # values of one CIF line, quoted values may contain blanks
+    if "'" in line or '"' in line:
+        try:
+            return shlex.split(line)
+        except ValueError:
+            pass
+    return line.split()
+
+def cif_symbols(column):
+    
+    # element symbols from _atom_site_type_symbol or _atom_site_label values the
+    # way cif2cell reads them: charges and digits stripped, then capitalized
+    uniq, inverse = np.unique(column, return_inverse = True)
+    symbols = []
+    for value in uniq:
+        value = value.decode('utf-8', errors = 'replace').strip(string.punctuation + string.digits)
+        if value == '':
+            value = '??'
+        symbols.append(value[0].upper() + value[1:].lower())
+    return np.array(symbols, dtype = str)[inverse]
+
+def cif_loop(buffer, start, end, ntag, keep):
+    
+    # columns keep of the rows of a loop body buffer[start:end] with ntag tags
+    # as a byte string array, converted chunk by chunk so the text is never
+    # split at once
+    chunks = []
+    rest = []
+    pos = start
+    while pos < end:
+        stop = end
+        if end - pos > CIF_CHUNK:
+            stop = buffer.rfind(b'\n', pos, pos + CIF_CHUNK) + 1
+            if stop <= pos:
+                stop = end
+        data = buffer[pos:stop]
+        pos = stop
+        
+        if b'#' in data or b"'" in data or b'"' in data:
+            tokens = []
+            for line in data.decode('utf-8', errors = 'replace').splitlines():
+                if not line.strip().startswith('#'):
+                    tokens.extend(cif_tokens(line))
+            tokens = [token.encode('utf-8') for token in tokens]
+        else:
+            tokens = data.split()
+        del data
+        
+        # rows may continue on the next line and so in the next chunk
+        tokens = rest + tokens
+        nrow = len(tokens) // ntag
+        rest = tokens[nrow*ntag:]
+        if nrow > 0:
+            chunks.append(np.array(tokens[:nrow*ntag], dtype = bytes).reshape(nrow, ntag)[:, keep].copy())
+        del tokens
+    
+    if rest:
+        raise ValueError('Malformed loop in CIF')
+    if len(chunks) == 0:
+        return np.zeros((0, len(keep)), dtype = bytes)
+    return np.concatenate(chunks)
+
+def parse_cif(buffer):
+    
+    # column-aware reader of the first data block of a CIF held in bytes or an
+    # mmap: tags and loops are located by byte offsets, only the header lines
+    # are decoded, the _atom_site loop becomes NumPy arrays
+    values = {}
+    loops = []
+    looptags = None
+    textfield = False
+    size = len(buffer)
+    pos = 0
+    while pos < size:
+        stop = buffer.find(b'\n', pos)
+        if stop < 0:
+            stop = size
+        line = buffer[pos:stop].decode('utf-8', errors = 'replace')
+        linestart = pos
+        pos = stop + 1
+        
+        if line.startswith(';'):
+            textfield = not textfield
+            looptags = None
+            continue
+        stripped = line.strip()
+        if textfield or stripped == '' or stripped.startswith('#'):
+            continue
+        lower = stripped.lower()
+        if lower.startswith('data_'):
+            if values or loops:
+                break
+            continue
+        if lower.startswith('loop_'):
+            looptags = []
+            continue
+        if stripped.startswith('_'):
+            if looptags is not None:
+                looptags.append(lower.split()[0])
+                continue
+            list = cif_tokens(stripped)
+            if len(list) > 1:
+                values[list[0].lower()] = list[1]
+            continue
+        if looptags is not None:
+            # first row of a loop, skip the body by its byte range
+            match = CIF_LOOPEND.search(buffer, linestart)
+            if match is None:
+                pos = size
+            else:
+                pos = match.start()
+            loops.append([looptags, linestart, pos])
+            looptags = None
+    
+    cif = {'lengths': [], 'angles': [], 'symops': [],
+           'hm': '', 'hall': '', 'number': 0}
+    for x in 'abc':
+        if f'_cell_length_{x}' not in values:
+            raise ValueError('Cell parameters not found')
+        cif['lengths'].append(float(values[f'_cell_length_{x}'].split('(')[0]))
+    for angle in ['alpha', 'beta', 'gamma']:
+        cif['angles'].append(float(values.get(f'_cell_angle_{angle}', '90').split('(')[0]))
+    for tag in ['_symmetry_space_group_name_h-m', '_space_group_name_h-m_alt']:
+        if tag in values:
+            cif['hm'] = values[tag]
+    for tag in ['_symmetry_space_group_name_hall', '_space_group_name_hall']:
+        if tag in values:
+            cif['hall'] = values[tag]
+    for tag in ['_symmetry_int_tables_number', '_space_group_it_number']:
+        if tag in values:
+            try:
+                cif['number'] = int(values[tag])
+            except ValueError:
+                pass
+    
+    sites = None
+    for tags, start, end in loops:
+        for tag in ['_symmetry_equiv_pos_as_xyz', '_space_group_symop_operation_xyz']:
+            if tag in tags:
+                columns = cif_loop(buffer, start, end, len(tags), [tags.index(tag)])
+                cif['symops'] = [value.decode('utf-8', errors = 'replace') for value in columns[:, 0]]
+        if '_atom_site_fract_x' in tags:
+            sites = [tags, start, end]
+    if sites is None:
+        raise ValueError('No _atom_site_fract_ loop found')
+    
+    # only the columns used below are kept
+    tags, start, end = sites
+    keep = [tag for tag in ['_atom_site_fract_x', '_atom_site_fract_y', '_atom_site_fract_z', '_atom_site_type_symbol',
+                            '_atom_site_label', '_atom_site_occupancy'] if tag in tags]
+    columns = cif_loop(buffer, start, end, len(tags), [tags.index(tag) for tag in keep])
+    
+    cif['x'] = np.stack([cif_numbers(columns[:, keep.index(f'_atom_site_fract_{x}')]) for x in 'xyz'], axis = 1)
+    
+    symbols = None
+    if '_atom_site_type_symbol' in keep:
+        symbols = columns[:, keep.index('_atom_site_type_symbol')]
+        if np.isin(symbols, [b'?', b'.']).any():
+            symbols = None
+    if symbols is None:
+        if '_atom_site_label' not in keep:
+            raise ValueError('No _atom_site_type_symbol or _atom_site_label in CIF')
+        symbols = columns[:, keep.index('_atom_site_label')]
+    cif['symbol'] = cif_symbols(symbols)
+    
+    cif['occupancy'] = np.ones(len(columns))
+    if '_atom_site_occupancy' in keep:
+        occupancy = columns[:, keep.index('_atom_site_occupancy')]
+        known = ~np.isin(occupancy, [b'?', b'.'])
+        cif['occupancy'][known] = cif_numbers(occupancy[known])
+    
+    return cif
+
+def read_cif(ciffile):
+    
+    # parse_cif over a read-only mmap of the file, the text is paged in by the
+    # kernel instead of being held as Python strings
+    f = open(ciffile,'rb')
+    try:
+        if os.fstat(f.fileno()).st_size == 0:
+            raise ValueError('Empty CIF')
+        buffer = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        try:
+            return parse_cif(buffer)
+        finally:
+            buffer.close()
+    finally:
+        f.close()
+
+def is_p1(cif):
+    
+    # True if the space group fields and symmetry operations of a parse_cif
+    # result all describe P1 and at least one of them is present
+    ops = [op.replace(' ', '').replace('+', '').lower() for op in cif['symops']]
+    if ops and ops != ['x,y,z']:
+        return False
+    hm = cif['hm'].replace(' ', '').lower()
+    hall = cif['hall'].replace(' ', '').lower()
+    for value in [hm, hall]:
+        if value not in ['', '?', '.', 'p1']:
+            return False
+    if cif['number'] not in [0, 1]:
+        return False
+    return hm == 'p1' or hall == 'p1' or cif['number'] == 1 or ops == ['x,y,z']
+
+def cif2cell_position(x, floats, eps):
+    
+    # one pass of cif2cell's LatticeVector: values within eps of a conspicuous
+    # number (1/3, 1/2, 0, ...) snapped to it, then mapped into [0,1-eps)
+    # with the same float operations, so the result is bit for bit the same
+    absx = np.abs(x)
+    snapped = x.copy()
+    done = np.zeros(x.shape, dtype = bool)
+    for f in floats:
+        hit = ~done & (np.abs(absx - f) <= eps)
+        snapped[hit] = np.copysign(f, x[hit])
+        done |= hit
+    
+    while True:
+        mask = snapped < 0.0
+        if not mask.any():
+            break
+        snapped[mask] += 1.0
+    while True:
+        mask = snapped >= 1.0 - eps
+        if not mask.any():
+            break
+        snapped[mask] -= 1.0
+    return snapped
+
+def cif2cell_pairs(x, eps):
+    
+    # pairs i < j of sites that cif2cell takes as the same position, all three
+    # coordinates within eps, found through a grid of eps cells
+    natom = len(x)
+    if natom < 2:
+        return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+    key = np.floor(x / eps).astype(np.int64) + 2
+    size = int(key.max()) + 3
+    code = (key[:, 0]*size + key[:, 1])*size + key[:, 2]
+    order = np.argsort(code, kind = 'stable')
+    sortedcode = code[order]
+    
+    pairs = [[], []]
+    for dx in [-1, 0, 1]:
+        for dy in [-1, 0, 1]:
+            for dz in [-1, 0, 1]:
+                target = code + (dx*size + dy)*size + dz
+                lo = np.searchsorted(sortedcode, target, side = 'left')
+                count = np.searchsorted(sortedcode, target, side = 'right') - lo
+                ncandidate = int(count.sum())
+                if ncandidate == 0:
+                    continue
+                i = np.repeat(np.arange(natom), count)
+                j = order[np.repeat(lo, count) + np.arange(ncandidate) - np.repeat(np.cumsum(count) - count, count)]
+                same = (i < j) & (np.abs(x[i] - x[j]) <= eps).all(axis = 1)
+                pairs[0].append(i[same])
+                pairs[1].append(j[same])
+    return np.concatenate(pairs[0]), np.concatenate(pairs[1])
+
+def p1_cell(cif2cellmodule, inputcif, ciftext = None):
+    
+    # lengths, angles and sites of a P1 input read directly, None for any other
+    # input. For P1 cif2cell only snaps, wraps, merges and sorts the given
+    # atoms, which is repeated here on arrays with the same tolerances and order
+    try:
+        if ciftext is None:
+            cif = read_cif(inputcif)
+        else:
+            cif = parse_cif(ciftext.encode('utf-8'))
+    except (OSError, ValueError):
+        return None
+    if not is_p1(cif):
+        return None
+    # partial occupancies are left to cif2cell
+    if (np.abs(cif['occupancy'] - 1.0) > 1e-6).any():
+        return None
+    
+    floats = cif2cellmodule.floatlist
+    eps = cif2cellmodule.GeometryObject().compeps
+    x = cif2cell_position(cif['x'], floats, eps)
+    symbols = cif['symbol'].tolist()
+    occupancy = cif['occupancy'].tolist()
+    
+    # sites at the same position are merged into the first one, which collects
+    # the species of the later ones in reverse order, as in getCrystalStructure
+    species = {}
+    first, later = cif2cell_pairs(x, eps)
+    for i, j in sorted(zip(first.tolist(), later.tolist()), key = lambda pair: (pair[0], -pair[1])):
+        ispecies = species.setdefault(i, {symbols[i]: occupancy[i]})
+        if symbols[j] in ispecies:
+            ispecies[symbols[j]] = occupancy[j] + ispecies[symbols[j]]
+        else:
+            ispecies[symbols[j]] = occupancy[j]
+    keep = np.ones(len(x), dtype = bool)
+    keep[later] = False
+    index = np.nonzero(keep)[0]
+    
+    # x,y,z only regenerates the stored site, which then goes through the
+    # identity transform (turning -0.0 into 0.0) before duplicates are weeded
+    # out once more, this time without merging
+    x = cif2cell_position(x[index] + 0.0, floats, eps)
+    keep = np.ones(len(x), dtype = bool)
+    keep[cif2cell_pairs(x, eps)[1]] = False
+    x = x[keep]
+    index = index[keep]
+    
+    # heaviest elements first, left as it is if any symbol is not an element
+    elementnr = cif2cellmodule.ed.elementnr
+    sitespecies = [species.get(i, {symbols[i]: occupancy[i]}) for i in index.tolist()]
+    heaviest = [max(ispecies, key = ispecies.get) for ispecies in sitespecies]
+    if all(symbol in elementnr for symbol in heaviest):
+        order = np.argsort(-np.array([elementnr[symbol] for symbol in heaviest], dtype = np.int64), kind = 'stable')
+        x = x[order]
+        sitespecies = [sitespecies[i] for i in order.tolist()]
+    
+    #label, symbol, symmetry, ux, uy, uz, occupancy
+    sites = []
+    for isite, [ispecies, ix] in enumerate(zip(sitespecies, x.tolist())):
+        for k, v in ispecies.items():
+            sites.append([f'{k}{isite + 1}', k, 1, ix[0], ix[1], ix[2], v])
+    return cif['lengths'], cif['angles'], sites
+
+def cif_name(path):
+    
+    # MOF name from a CIF path or archive member, without .cif/.cif.gz
+    name = os.path.basename(str(path))
+    if name.lower().endswith('.gz'):
+        name = name[:-3]
+    return os.path.splitext(name)[0]
+
+def member_name(filename):
+    
+    # MOF name of an archive member from its path inside the archive, folders
+    # joined with '_' so that a/x.cif and b/x.cif get different output folders
+    parts = [part for part in filename.split('/') if part not in ['', '.']]
+    return '_'.join(parts[:-1] + [cif_name(parts[-1])])
+
+def MOFdecompose(cif2cell, inputcif, outputdir, ciftext = None, MOFname = None, fragments = None, stages = None, reducecell = False):
+    
+    if stages is None:
+        stages = STAGES()
 
     # read cif and create sub-dirctory
     InputMOF = inputcif
-    MOFname = str(Path(inputcif).stem) 
+    if MOFname is None:
+        MOFname = cif_name(inputcif)
     outputfolder = f'{outputdir}/{MOFname}/'
-    PrimitiveMOF = f'{outputfolder}/{MOFname}_primitive.cif'
-    shutil.rmtree(f'{outputfolder}', ignore_errors=True)
-    os.makedirs(f'{outputfolder}', exist_ok=True)
-    os.system(f"cp {InputMOF} {PrimitiveMOF}")
-    os.system(f"python {cif2cell} -q -f {PrimitiveMOF} -p cif -o {PrimitiveMOF}")  
+    if fragments is None:
+        shutil.rmtree(f'{outputfolder}', ignore_errors=True)
+        os.makedirs(f'{outputfolder}', exist_ok=True)
+    
+    # reduce to primitive cell in-process
+    iMOF = MOF(str(InputMOF))
+    stages.mof = iMOF
+    if stages.profile:
+        iMOF.enable_counters()
+    cif2cellmodule = import_cif2cell(cif2cell)
+    with stages('read_p1'):
+        cell = p1_cell(cif2cellmodule, str(InputMOF), ciftext)
+    if cell is None:
+        try:
+            with stages('reduce_to_primitive'):
+                if ciftext is None:
+                    primitive = cif2cellmodule.reduce_to_primitive(str(InputMOF))
+                else:
+                    primitive = cif2cellmodule.reduce_to_primitive(ciftext)
+                lengths, angles = cif2cellmodule.cell_parameters(primitive, primitive.spacegroupsetting != 'P')
+                cell = [lengths, angles, cif2cellmodule.cell_sites(primitive)]
+        except Exception as e:
+            # as with the cif2cell script before, any failure leaves the input
+            # as it is, not only the CellError, PositionError and SymmetryError
+            # it raises on purpose; the error is kept for the records
+            stages.fallback = f'{type(e).__name__}: {e}'
+            cell = None
+    with stages('get_boxinfo'):
+        if cell is None:
+            # cif2cell could not set up the cell, read the input as it is
+            iMOF.get_boxinfo(ciftext)
+        else:
+            iMOF.get_boxinfo_from_cell(*cell)
+    stages.natom = len(iMOF.atom)
+        
     # decompose MOF
-    iMOF = MOF(PrimitiveMOF)
-    iMOF.get_boxinfo()
-    iMOF.get_hmatrix()
-    iMOF.get_atomtypelist()
-    iMOF.get_metaltypelist()
-    iMOF.get_atomgridinfo()
-    iMOF.clear_neighborlist()
-    iMOF.get_neighborlist(True)
-    iMOF.get_solvent()
-    iMOF.break_mof()
-
-
+    with stages('get_hmatrix'):
+        iMOF.get_hmatrix()
+    if reducecell:
+        with stages('reduce_cell'):
+            iMOF.reduce_cell()
+    with stages('get_atomtypelist'):
+        iMOF.get_atomtypelist()
+    with stages('get_metaltypelist'):
+        iMOF.get_metaltypelist()
+    with stages('get_atomgridinfo'):
+        iMOF.get_atomgridinfo()
+    with stages('clear_neighborlist'):
+        iMOF.clear_neighborlist()
+    with stages('get_neighborlist'):
+        iMOF.get_neighborlist(method = 'auto')
+    if reducecell:
+        with stages('restore_cell'):
+            iMOF.restore_cell()
+    with stages('get_solvent'):
+        iMOF.get_solvent()
+    with stages('break_mof'):
+        iMOF.break_mof()
+
+
+    nnode = 0
     if len(iMOF.metalnodelist) > 0:
-        uniqmetalnodelist = iMOF.get_uniq_fragmentlist(iMOF.metalnodelist, 0)
+        with stages('get_uniq_fragmentlist'):
+            uniqmetalnodelist = iMOF.get_uniq_fragmentlist(iMOF.metalnodelist, 0)
         count = 0
         for uniq in uniqmetalnodelist:
+            if fragments is not None:
+                with stages('get_fragment_arrays'):
+                    fragments.append(['node', count, iMOF.get_fragment_arrays(uniq, 2)])
+                count += 1
+                continue
             xyzfile = outputfolder + 'node-' + str(count) + '.xyz'
-            iMOF.write_xyz(uniq, xyzfile, 2)
+            with stages('write_xyz'):
+                iMOF.write_xyz(uniq, xyzfile, 2)
 
             ciffile = outputfolder + 'node-' + str(count) + '.cif'
-            iMOF.write_cif(uniq, ciffile, 2)
+            with stages('write_cif'):
+                iMOF.write_cif(uniq, ciffile, 2)
             count += 1
+        nnode = count
 
+    nlinker = 0
     if len(iMOF.linkerlist) > 0:
-        uniqlinkerlist = iMOF.get_uniq_fragmentlist(iMOF.linkerlist, 1)
+        with stages('get_uniq_fragmentlist'):
+            uniqlinkerlist = iMOF.get_uniq_fragmentlist(iMOF.linkerlist, 1)
         count = 0
         for uniq in uniqlinkerlist:
+            if fragments is not None:
+                with stages('get_fragment_arrays'):
+                    fragments.append(['linker', count, iMOF.get_fragment_arrays(uniq, 2)])
+                count += 1
+                continue
             xyzfile = outputfolder + 'linker-' + str(count) + '.xyz'
-            iMOF.write_xyz(uniq, xyzfile, 2)
+            with stages('write_xyz'):
+                iMOF.write_xyz(uniq, xyzfile, 2)
 
             ciffile = outputfolder + 'linker-' + str(count) + '.cif'
-            iMOF.write_cif(uniq, ciffile, 2)
+            with stages('write_cif'):
+                iMOF.write_cif(uniq, ciffile, 2)
             count += 1
+        nlinker = count
+    
+    return len(iMOF.atom), nnode, nlinker
+    
+
+def file_sha256(path):
+    
+    sha = hashlib.sha256()
+    f = open(path,'rb')
+    for block in iter(lambda: f.read(1 << 20), b''):
+        sha.update(block)
+    f.close()
+    
+    return sha.hexdigest()
+
+def is_cifname(name):
+    
+    name = name.lower()
+    return name.endswith('.cif') or name.endswith('.cif.gz')
+
+def iter_cifblocks(lines):
+    
+    # split CIF lines (bytes) at each data_ heading without parsing them,
+    # lines before the first heading belong to the first block
+    blockname = None
+    block = []
+    textfield = False
+    for line in lines:
+        if line.startswith(b';'):
+            textfield = not textfield
+        elif not textfield and line[:5].lower() == b'data_':
+            if blockname is not None:
+                yield blockname, b''.join(block)
+                block = []
+            blockname = line.split()[0][5:].decode('utf-8', errors = 'replace')
+        block.append(line)
+        
+    if blockname is not None:
+        yield blockname, b''.join(block)
+
+def iter_blockinputs(input, lines):
+    
+    # one input per data_ block, named after the block
+    for blockname, data in iter_cifblocks(lines):
+        yield {'path': f'{input["path"]}:data_{blockname}', 'name': blockname.replace(os.sep, '_'),
+               'data': data, 'size': len(data), 'mtime': input['mtime']}
+
+def iter_inputfile(path, blocks = False):
+    
+    # CIFs in one input file; archive members and data_ blocks are read into
+    # memory one at a time
+    name = path.name.lower()
+    if is_cifname(name):
+        stat = path.stat()
+        input = {'path': str(path), 'name': cif_name(path), 'data': None,
+                 'size': stat.st_size, 'mtime': stat.st_mtime}
+        if blocks:
+            if name.endswith('.gz'):
+                f = gzip.open(path,'rb')
+            else:
+                f = open(path,'rb')
+            yield from iter_blockinputs(input, f)
+            f.close()
+        else:
+            yield input
+        
+    elif name.endswith('.zip'):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if info.is_dir() or not is_cifname(info.filename):
+                    continue
+                data = archive.read(info)
+                if info.filename.lower().endswith('.gz'):
+                    data = gzip.decompress(data)
+                mtime = datetime.datetime(*info.date_time).timestamp()
+                input = {'path': f'{path}:{info.filename}', 'name': member_name(info.filename),
+                         'data': data, 'size': len(data), 'mtime': mtime}
+                if blocks:
+                    yield from iter_blockinputs(input, data.splitlines(True))
+                else:
+                    yield input
+                
+    elif name.endswith('.tar') or name.endswith('.tar.gz') or name.endswith('.tgz'):
+        with tarfile.open(path, 'r:*') as archive:
+            for member in archive:
+                if not member.isfile() or not is_cifname(member.name):
+                    continue
+                data = archive.extractfile(member).read()
+                if member.name.lower().endswith('.gz'):
+                    data = gzip.decompress(data)
+                input = {'path': f'{path}:{member.name}', 'name': member_name(member.name),
+                         'data': data, 'size': len(data), 'mtime': float(member.mtime)}
+                if blocks:
+                    yield from iter_blockinputs(input, data.splitlines(True))
+                else:
+                    yield input
+
+def iter_inputpaths(inputs, blocks = False):
+    
+    # inputs are directories, CIF/CIF.gz files or zip/tar archives
+    for input in inputs:
+        input = pathlib.Path(input)
+        if input.is_dir():
+            for path in sorted(input.iterdir()):
+                yield from iter_inputfile(path, blocks)
+        else:
+            yield from iter_inputfile(input, blocks)
+
+def iter_inputs(inputs, blocks = False):
+    
+    # a name already taken by an earlier input, such as x.cif next to an
+    # archive member x.cif or a data_ block named the same in two files, gets a
+    # short hash of its path so that every MOF has its own output folder
+    names = set()
+    for input in iter_inputpaths(inputs, blocks):
+        if input['name'] in names:
+            name = f'{input["name"]}_{hashlib.sha256(input["path"].encode()).hexdigest()[:8]}'
+            print(f'Duplicate MOF name "{input["name"]}": "{input["path"]}" is named "{name}"')
+            input['name'] = name
+        names.add(input['name'])
+        yield input
+
+def task_bytes(task):
+    
+    if task['data'] is not None:
+        return task['data']
+    
+    if task['path'].lower().endswith('.gz'):
+        f = gzip.open(task['path'],'rb')
+    else:
+        f = open(task['path'],'rb')
+    data = f.read()
+    f.close()
+    
+    return data
+
+def save_failcif(task, faildir):
     
-    return
+    if task['data'] is None:
+        shutil.copy(task['path'], faildir)
+    else:
+        f = open(f'{faildir}/{task["name"]}.cif','wb')
+        f.write(task['data'])
+        f.close()
+
+def task_sha256(task):
+    
+    # SHA-256 of the CIF bytes, files are hashed in 1 MB blocks instead of read whole
+    if task['data'] is not None:
+        return hashlib.sha256(task['data']).hexdigest()
+    if not task['path'].lower().endswith('.gz'):
+        return file_sha256(task['path'])
+    
+    sha = hashlib.sha256()
+    f = gzip.open(task['path'],'rb')
+    for block in iter(lambda: f.read(1 << 20), b''):
+        sha.update(block)
+    f.close()
+    
+    return sha.hexdigest()
+
+def new_result(task, data = None):
+    
+    path = task['path']
+    if data is None:
+        sha256 = task_sha256(task)
+    else:
+        sha256 = hashlib.sha256(data).hexdigest()
+    
+    return {'cif': task['name'], 'path': path, 'size': task['size'], 'mtime': task['mtime'],
+            'sha256': sha256, 'success': False, 'reason': '',
+            'natom': 0, 'nnode': 0, 'nlinker': 0, 'time': 0.0, 'outputs': [], 'cached': False,
+            'stage': '', 'exception': '', 'message': '', 'location': '', 'fallback': '', 'cause': '', 'stages': {}, 'peak_rss': 0.0, 'profile': {}, 'counters': {},
+            'predicted': task.get('predicted', 0.0)}
+
+def read_manifest(manifestfile):
+    
+    # latest record per input path, a truncated last line is ignored
+    manifest = {}
+    if not os.path.exists(manifestfile):
+        return manifest
+    
+    f = open(manifestfile,'r')
+    for line in f:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            continue
+        manifest[record['path']] = record
+    f.close()
+    
+    return manifest
+
+def write_manifest_record(f, result):
     
+    record = dict(result)
+    if result['success']:
+        record['status'] = 'done'
+    else:
+        record['status'] = 'failed'
+    f.write(json.dumps(record) + '\n')
+    f.flush()
+
+def write_failure_record(failfile, result):
     
+    # one JSON record per failed CIF for triage by stage and exception
+    keys = ['cif', 'path', 'reason', 'stage', 'exception', 'message', 'location', 'cause', 'natom', 'stages', 'peak_rss', 'time']
+    f = open(failfile,'a')
+    f.write(json.dumps({key: result[key] for key in keys}) + '\n')
+    f.close()
+
+def check_done(task, record):
+    
+    # True if the manifest shows this exact input already decomposed
+    if record is None or record['status'] != 'done':
+        return False
+    
+    for output in record['outputs']:
+        if not os.path.exists(output):
+            return False
+    
+    if task['size'] == record['size'] and task['mtime'] == record['mtime']:
+        return True
+    
+    return task_sha256(task) == record['sha256']
+
+def parse_shard(text):
+    
+    # "i/N" with 0 <= i < N
+    try:
+        ishard, nshard = [int(x) for x in text.split('/')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'shard must be i/N, got "{text}"')
+    if nshard < 1 or ishard < 0 or ishard >= nshard:
+        raise argparse.ArgumentTypeError(f'shard must be i/N with 0 <= i < N, got "{text}"')
+    return ishard, nshard
+
+def shard_of(name, nshard):
+    
+    # stable across runs and machines, unlike hash()
+    return int(hashlib.sha256(name.encode('utf-8')).hexdigest(), 16) % nshard
+
+def shard_dir(dirname, shard):
+    return f'{dirname}/shard-{shard[0]}-of-{shard[1]}'
+
+# Cost of one MOF in seconds from its atom count in the conventional cell as
+# linear and quadratic coefficients, fitted on the generated MOFs of
+# benchmarks/scaling.py in P1 and P 1 1 2. P1 inputs are read directly, the
+# others pay for the duplicate search of cif2cell
+PLAN_P1 = [1e-4, 4e-8]
+PLAN_SYMMETRY = [5e-4, 8e-7]
+PLAN_CENTERING = {'P': 1, 'A': 2, 'B': 2, 'C': 2, 'I': 2, 'R': 3, 'F': 4}
+PLAN_MAXSYMOP = 192
+
+def cif_number(text):
+    
+    # CIF number without its standard uncertainty, None if not a number
+    try:
+        return float(text.split('(')[0])
+    except ValueError:
+        return None
+
+def scan_cif(data, sgdata):
+    
+    # cheap scan of the first data block: cell lengths, _atom_site rows and
+    # symmetry operations, without building the cell
+    values = {}
+    loops = []
+    inloop = False
+    textfield = False
+    for line in data.decode('utf-8', errors = 'replace').splitlines():
+        if line.startswith(';'):
+            textfield = not textfield
+            continue
+        stripped = line.strip()
+        if textfield or stripped == '' or stripped.startswith('#'):
+            continue
+        lower = stripped.lower()
+        if lower.startswith('data_'):
+            if values or loops:
+                break
+            continue
+        if lower.startswith('loop_'):
+            loops.append([[], 0, []])
+            inloop = True
+            continue
+        if stripped.startswith('_'):
+            if inloop and loops[-1][1] == 0:
+                loops[-1][0].append(lower.split()[0])
+                continue
+            inloop = False
+            list = stripped.split(None, 1)
+            if len(list) > 1:
+                values[list[0].lower()] = list[1].strip().strip('\'"')
+            continue
+        if inloop:
+            loops[-1][1] += 1
+            # rows of the short symmetry loops are kept for is_p1
+            if loops[-1][1] <= PLAN_MAXSYMOP:
+                loops[-1][2].append(stripped)
+    
+    nsites = 0
+    nsymop = 0
+    symops = []
+    for tags, nrows, rows in loops:
+        if '_atom_site_fract_x' in tags or '_atom_site_cartn_x' in tags:
+            nsites = nrows
+        for tag in ['_symmetry_equiv_pos_as_xyz', '_space_group_symop_operation_xyz']:
+            if tag in tags:
+                nsymop = nrows
+                symops = [cif_tokens(row)[tags.index(tag)] for row in rows if len(cif_tokens(row)) == len(tags)]
+                if len(symops) != nrows:
+                    symops = []
+    
+    # Hall symbol as cif2cell normalizes it
+    hall = ''
+    for tag in ['_symmetry_space_group_name_hall', '_space_group_name_hall']:
+        if values.get(tag, '') not in ['', '?', '.']:
+            hall = values[tag]
+            if hall[0] == '-':
+                hall = '-' + hall[1].upper() + hall[2:].lower()
+            else:
+                hall = hall[0].upper() + hall[1:].lower()
+    if hall not in sgdata.SymOpsHall:
+        hall = ''
+        for tag in ['_symmetry_space_group_name_h-m', '_space_group_name_h-m_alt']:
+            hm = values.get(tag, '').replace(' ', '')
+            if hm not in ['', '?', '.']:
+                hm = hm[0].upper() + hm[1:].lower()
+                if hm[-1] in 'rhsz':
+                    hm = hm[:-1] + hm[-1].upper()
+                hall = sgdata.HM2Hall.get(hm, '')
+    if hall == '':
+        for tag in ['_symmetry_int_tables_number', '_space_group_it_number']:
+            number = cif_number(values.get(tag, ''))
+            if number is not None:
+                hall = sgdata.Number2Hall.get(int(number), '')
+    
+    if nsymop == 0 and hall in sgdata.SymOpsHall:
+        nsymop = len(sgdata.SymOpsHall[hall])
+    nsymop = max(nsymop, 1)
+    centering = PLAN_CENTERING.get(hall.lstrip('-')[:1], 1)
+    
+    # P1 as p1_cell decides it, partial occupancies that send a P1 input
+    # through cif2cell as well are not scanned
+    number = cif_number(values.get('_symmetry_int_tables_number', values.get('_space_group_it_number', '')))
+    p1 = is_p1({'symops': symops, 'number': int(number or 0),
+                'hm': values.get('_symmetry_space_group_name_h-m', values.get('_space_group_name_h-m_alt', '')),
+                'hall': values.get('_symmetry_space_group_name_hall', values.get('_space_group_name_hall', ''))})
+    linear, quadratic = PLAN_SYMMETRY
+    if p1:
+        linear, quadratic = PLAN_P1
+    
+    # upper bound, atoms on special positions are counted more than once
+    nconv = nsites * nsymop
+    return {'lengths': [cif_number(values.get(f'_cell_length_{x}', '')) for x in 'abc'],
+            'hall': hall, 'nsites': nsites, 'nsymop': nsymop, 'natom': nconv // centering, 'p1': p1,
+            'cost': linear * nconv + quadratic * nconv**2}
+
+def plan_tasks(tasks, cif2cell):
+    
+    # scan every task and sort the most expensive first
+    import_cif2cell(cif2cell)
+    sgdata = importlib.import_module('spacegroupdata')
+    
+    planned = []
+    for task in tasks:
+        try:
+            plan = scan_cif(task_bytes(task), sgdata)
+        except OSError:
+            plan = scan_cif(b'', sgdata)
+        task['plan'] = plan
+        task['predicted'] = plan['cost']
+        planned.append(task)
+    planned.sort(key = lambda task: task['predicted'], reverse = True)
+    
+    return planned
+
+def predict_makespan(costs, jobs):
+    
+    # wall time of a greedy largest-first assignment to jobs workers
+    loads = [0.0] * jobs
+    for cost in sorted(costs, reverse = True):
+        heapq.heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+def iter_tasks(inputs, blocks, task, manifest, skipped, shard = None):
+    
+    # one task per input CIF, skipping those finished according to the manifest
+    # and, with a shard, those belonging to other shards
+    for input in iter_inputs(inputs, blocks):
+        if shard is not None and shard_of(input['name'], shard[1]) != shard[0]:
+            continue
+        itask = dict(task)
+        itask.update(input)
+        if manifest and check_done(itask, manifest.get(itask['path'])):
+            skipped.append(itask['path'])
+            continue
+        yield itask
+
+def cache_params(cif2cell):
+    
+    # hash of everything besides the CIF that changes the building blocks:
+    # bond skin, radii and metal tables and the code itself
+    lib = LIBRARY()
+    sha = hashlib.sha256()
+    sha.update(f'skin={lib.skin}'.encode())
+    
+    codefiles = [lib.ATRcsv, lib.METALcsv, os.path.abspath(__file__)]
+    codefiles += sorted(str(path) for path in Path(cif2cell).parent.glob('*.py'))
+    for path in codefiles:
+        sha.update(file_sha256(path).encode())
+        
+    return sha.hexdigest()
+
+def cache_lookup(cachedir, key, outputfolder, ciffile):
+    
+    # recreate the output folder from a cache entry, hardlinking when possible
+    # the first line of a .cif names its source CIF, so those are copied with
+    # the header of this MOF instead of the one that filled the entry
+    entry = f'{cachedir}/{key}'
+    try:
+        f = open(f'{entry}/result.json','r')
+        counts = json.load(f)
+        f.close()
+    except (OSError, ValueError):
+        return None
+    
+    shutil.rmtree(outputfolder, ignore_errors=True)
+    os.makedirs(outputfolder, exist_ok=True)
+    for name in os.listdir(entry):
+        if name == 'result.json':
+            continue
+        if name.endswith('.cif'):
+            fin = open(f'{entry}/{name}','r')
+            fin.readline()
+            fout = open(f'{outputfolder}/{name}','w')
+            fout.write(ciffile + '\n')
+            shutil.copyfileobj(fin, fout)
+            fout.close()
+            fin.close()
+            continue
+        try:
+            os.link(f'{entry}/{name}', f'{outputfolder}/{name}')
+        except OSError:
+            shutil.copy(f'{entry}/{name}', f'{outputfolder}/{name}')
+    
+    # mark as recently used
+    os.utime(entry)
+    
+    return counts
+
+def cache_store(cachedir, key, outputfolder, counts):
+    
+    # copy into a private folder first so concurrent workers never see a partial entry
+    entry = f'{cachedir}/{key}'
+    if os.path.exists(entry):
+        return
+    
+    tmpentry = f'{cachedir}/.{key}.{os.getpid()}'
+    shutil.rmtree(tmpentry, ignore_errors=True)
+    shutil.copytree(outputfolder, tmpentry)
+    f = open(f'{tmpentry}/result.json','w')
+    json.dump(counts, f)
+    f.close()
+    
+    try:
+        os.rename(tmpentry, entry)
+    except OSError:
+        shutil.rmtree(tmpentry, ignore_errors=True)
+
+def cache_evict(cachedir, maxsize):
+    
+    # remove least recently used entries until the cache is below maxsize MB
+    entries = []
+    totsize = 0
+    for entry in os.scandir(cachedir):
+        if not entry.is_dir() or entry.name.startswith('.'):
+            continue
+        size = 0
+        for ifile in os.scandir(entry.path):
+            size += ifile.stat().st_size
+        entries.append([entry.stat().st_mtime, size, entry.path])
+        totsize += size
+        
+    entries.sort()
+    nevict = 0
+    for mtime, size, path in entries:
+        if totsize <= maxsize * 1024 * 1024:
+            break
+        shutil.rmtree(path, ignore_errors=True)
+        totsize -= size
+        nevict += 1
+        
+    return nevict
+
+def decompose_worker(task, report = None):
+    
+    # decompose one MOF and return a small result record
+    # report(stages) is called as each stage starts
+    # plain files are read through read_cif by path, only archive members and
+    # gzip files are held in memory and passed on as text
+    reset_peak_rss()
+    data = None
+    if task['data'] is not None or task['path'].lower().endswith('.gz'):
+        data = task_bytes(task)
+    result = new_result(task, data)
+    outputfolder = f'{task["outputdir"]}/{result["cif"]}'
+    
+    cachekey = None
+    if task['cachedir']:
+        sha = hashlib.sha256()
+        sha.update((result['sha256'] + task['cacheparams']).encode())
+        cachekey = sha.hexdigest()
+    
+    stages = STAGES(report, task['profile'])
+    start = time.perf_counter()
+    try:
+        counts = None
+        if cachekey:
+            counts = cache_lookup(task['cachedir'], cachekey, outputfolder, task['path'])
+            
+        fragments = None
+        if task['pack']:
+            fragments = []
+            
+        if counts is None:
+            ciftext = None
+            if data is not None:
+                ciftext = data.decode('utf-8', errors = 'replace')
+            natom, nnode, nlinker = MOFdecompose(cif2cell = task['cif2cell'], inputcif = task['path'], outputdir = task['outputdir'],
+                                                 ciftext = ciftext, MOFname = task['name'],
+                                                 fragments = fragments, stages = stages, reducecell = task['reducecell'])
+            counts = {'natom': natom, 'nnode': nnode, 'nlinker': nlinker}
+            if cachekey:
+                cache_store(task['cachedir'], cachekey, outputfolder, counts)
+        else:
+            result['cached'] = True
+            
+        result.update(counts)
+        result['success'] = True
+        if fragments is None:
+            result['outputs'] = sorted(f'{outputfolder}/{name}' for name in os.listdir(outputfolder))
+        else:
+            # written to the pack file by the parent
+            result['fragments'] = fragments
+    except Exception as e:
+        result['reason'] = 'error'
+        result['stage'] = stages.stage
+        result['exception'] = type(e).__name__
+        result['message'] = str(e)
+        frame = traceback.extract_tb(e.__traceback__)[-1]
+        result['location'] = f'{os.path.basename(frame.filename)}:{frame.lineno} in {frame.name}'
+        result['natom'] = stages.natom
+        # the raw CIF was only read because cif2cell failed first
+        if stages.fallback and result['stage'] == 'get_boxinfo':
+            result['cause'] = f'cif2cell: {stages.fallback}'
+    result['fallback'] = stages.fallback
+    result['time'] = time.perf_counter() - start
+    result['stages'] = stages.elapsed
+    result['profile'] = stages.records
+    if stages.mof is not None and stages.mof.counters is not None:
+        result['counters'] = stages.mof.counters
+    result['peak_rss'] = peak_rss()
+    
+    return result
+
+def worker_loop(conn):
+    
+    # runs in the worker process until the supervisor sends None
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        # stage progress goes to the supervisor so a killed MOF still has a stage
+        conn.send(decompose_worker(task, lambda stages: conn.send(['stage', stages.stage, stages.elapsed, stages.natom])))
+    conn.close()
+
+class WORKER:
+    
+    def __init__ (self):
+        
+        self.conn, childconn = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target = worker_loop, args = (childconn,), daemon = True)
+        self.process.start()
+        childconn.close()
+        
+        self.task = None
+        self.start = 0.0
+        self.ntask = 0
+        self.stage = ''
+        self.stages = {}
+        self.stagestart = 0.0
+        self.natom = 0
+        
+    def submit(self, task):
+        self.conn.send(task)
+        self.task = task
+        self.start = time.perf_counter()
+        self.ntask += 1
+        self.stage = ''
+        self.stages = {}
+        self.stagestart = self.start
+        self.natom = 0
+        
+    def set_stage(self, stage, elapsed, natom):
+        self.stage = stage
+        self.stages = elapsed
+        self.natom = natom
+        self.stagestart = time.perf_counter()
+        
+    def get_stages(self):
+        
+        # stage times reported so far plus the running stage
+        stages = dict(self.stages)
+        if self.stage:
+            stages[self.stage] = stages.get(self.stage, 0.0) + time.perf_counter() - self.stagestart
+        return stages
+        
+    def elapsed(self):
+        return time.perf_counter() - self.start
+        
+    def get_rss(self, key = 'VmRSS'):
+        
+        # resident set size in MB (peak with key 'VmHWM'), 0.0 if unknown
+        try:
+            f = open(f'/proc/{self.process.pid}/status','r')
+            lines = f.readlines()
+            f.close()
+        except OSError:
+            return 0.0
+        
+        for line in lines:
+            list = line.split()
+            if len(list) > 1 and list[0] == key + ':':
+                return float(list[1]) / 1024.0
+        return 0.0
+        
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(1.0)
+        if self.process.is_alive():
+            self.kill()
+        self.conn.close()
+        
+    def kill(self):
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+def run_supervised(tasks, jobs, timeout, maxrss, maxtasks):
+    
+    # supervise a fixed number of worker processes, killing and replacing any
+    # worker that exceeds the wall-clock or memory limit for its current MOF
+    # tasks are consumed lazily and workers are started as tasks arrive
+    pending = iter(tasks)
+    exhausted = False
+    workers = []
+    polltime = 0.2
+    
+    try:
+        while True:
+            for iworker in workers:
+                if iworker.task is None and not exhausted:
+                    task = next(pending, None)
+                    if task is None:
+                        exhausted = True
+                    else:
+                        iworker.submit(task)
+            while len(workers) < jobs and not exhausted:
+                task = next(pending, None)
+                if task is None:
+                    exhausted = True
+                else:
+                    workers.append(WORKER())
+                    workers[-1].submit(task)
+                    
+            busy = [iworker for iworker in workers if iworker.task is not None]
+            if not busy:
+                break
+            multiprocessing.connection.wait([iworker.conn for iworker in busy], polltime)
+            
+            for k, iworker in enumerate(workers):
+                if iworker.task is None:
+                    continue
+                
+                result = None
+                replace = False
+                while iworker.conn.poll():
+                    try:
+                        message = iworker.conn.recv()
+                    except EOFError:
+                        break
+                    if isinstance(message, list):
+                        iworker.set_stage(message[1], message[2], message[3])
+                    else:
+                        result = message
+                        break
+
+                # worker done with its share of tasks, replaced by a fresh process
+                if result is not None and maxtasks and iworker.ntask >= maxtasks:
+                    iworker.stop()
+                    replace = True
+
+                if result is None:
+                    reason = ''
+                    if not iworker.process.is_alive():
+                        reason = 'crash'
+                    elif timeout and iworker.elapsed() > timeout:
+                        reason = 'timeout'
+                    elif maxrss and iworker.get_rss() > maxrss:
+                        reason = 'oom'
+                        
+                    if reason:
+                        result = new_result(iworker.task)
+                        result['reason'] = reason
+                        result['time'] = iworker.elapsed()
+                        result['stage'] = iworker.stage
+                        result['stages'] = iworker.get_stages()
+                        result['natom'] = iworker.natom
+                        result['peak_rss'] = iworker.get_rss('VmHWM')
+                        iworker.kill()
+                        replace = True
+                
+                if result is not None:
+                    task = iworker.task
+                    iworker.task = None
+                    # a fresh process only for a task still waiting to run
+                    if replace and not exhausted:
+                        following = next(pending, None)
+                        if following is None:
+                            exhausted = True
+                        else:
+                            workers[k] = WORKER()
+                            workers[k].submit(following)
+                    yield task, result
+    finally:
+        for iworker in workers:
+            if iworker.task is None:
+                iworker.stop()
+            else:
+                iworker.kill()
+
+def run_tasks(tasks, jobs, timeout = None, maxrss = None, maxtasks = None):
+    
+    # serial in-process for a single job without limits, supervised workers
+    # otherwise; maxtasks None recycles workers after 100 MOFs, a value given
+    # by the user needs workers even for a single job
+    if jobs > 1 or timeout or maxrss or maxtasks:
+        if maxtasks is None:
+            maxtasks = 100
+        for task, result in run_supervised(tasks, jobs, timeout, maxrss, maxtasks):
+            yield task, result
+    else:
+        for task in tasks:
+            yield task, decompose_worker(task)
+    
+def merge_shards(outputdir, faildir):
+    
+    # move the outputs of every shard-*-of-* folder into one result tree,
+    # rewriting the manifest paths and appending pack, manifest and failure
+    # records; the stage profiles of --profile runs are summarized over all shards
+    shards = sorted(name for name in os.listdir(outputdir) if name.startswith('shard-') and os.path.isdir(f'{outputdir}/{name}'))
+    if len(shards) == 0:
+        print(f'No shard folders found in "{outputdir}"')
+        return 0
+    
+    nshard = set(int(name.split('-')[-1]) for name in shards)
+    if len(nshard) != 1:
+        raise ValueError(f'Shards of different runs found: {shards}')
+    nshard = nshard.pop()
+    if len(shards) != nshard:
+        print(f'Warning: {len(shards)} of {nshard} shard(s) found')
+    
+    pack = PACK(f'{outputdir}/buildingblocks.pack')
+    fmanifest = open(f'{outputdir}/manifest.jsonl','a')
+    nrecord = 0
+    profiles = []
+    for name in shards:
+        ishardoutput = f'{outputdir}/{name}'
+        ishardfail = f'{faildir}/{name}'
+        
+        # building blocks, per-MOF folders or the pack
+        ipack = PACK(f'{ishardoutput}/buildingblocks.pack')
+        if os.path.exists(ipack.packfile):
+            if not os.path.exists(pack.packfile):
+                pack.create()
+            for record in ipack.open():
+                pack.append(record['mof'], [[record['kind'], record['ordinal'],
+                                             dict(ipack.read(record), ciffile = record['ciffile'], lx = record['lx'], angles = record['angles'])]])
+            ipack.close()
+        for MOFname in os.listdir(ishardoutput):
+            if os.path.isdir(f'{ishardoutput}/{MOFname}'):
+                shutil.rmtree(f'{outputdir}/{MOFname}', ignore_errors=True)
+                os.replace(f'{ishardoutput}/{MOFname}', f'{outputdir}/{MOFname}')
+                
+        for record in read_manifest(f'{ishardoutput}/manifest.jsonl').values():
+            outputs = []
+            for output in record['outputs']:
+                if output in [ipack.packfile, ipack.indexfile]:
+                    output = output.replace(ipack.packfile, pack.packfile).replace(ipack.indexfile, pack.indexfile)
+                else:
+                    output = output.replace(f'{ishardoutput}/', f'{outputdir}/', 1)
+                outputs.append(output)
+            record['outputs'] = outputs
+            fmanifest.write(json.dumps(record) + '\n')
+            nrecord += 1
+            if record.get('profile'):
+                profiles.append(record['profile'])
+            
+        # failed CIFs and their reasons
+        if os.path.isdir(ishardfail):
+            for failname in os.listdir(ishardfail):
+                if failname == 'failures.jsonl':
+                    f = open(f'{ishardfail}/{failname}','r')
+                    failures = f.read()
+                    f.close()
+                    f = open(f'{faildir}/failures.jsonl','a')
+                    f.write(failures)
+                    f.close()
+                else:
+                    os.replace(f'{ishardfail}/{failname}', f'{faildir}/{failname}')
+            shutil.rmtree(ishardfail)
+        shutil.rmtree(ishardoutput)
+        print(f'Merged {name}')
+    fmanifest.close()
+    
+    if profiles:
+        f = open(f'{outputdir}/profile.json','w')
+        json.dump(profile_summary(profiles), f, indent = 1)
+        f.close()
+    
+    return nrecord
+
 def main():
     
-    inputdir = './Inputcifs'
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        parser = argparse.ArgumentParser(prog = f'{sys.argv[0]} merge',
+                                         description = 'Merge the shard-*-of-* outputs of a sharded run into one result tree')
+        parser.parse_args(sys.argv[2:])
+        os.makedirs('./Failcifs', exist_ok=True)
+        nrecord = merge_shards('./BUoutput', './Failcifs')
+        print(f'Merge Finished: {nrecord} manifest record(s)')
+        return
+    
+    parser = argparse.ArgumentParser(description = 'Decompose MOFs into building blocks')
+    parser.add_argument('inputs', nargs = '*', default = ['./Inputcifs'],
+                        help = 'input directories, .cif/.cif.gz files or .zip/.tar/.tar.gz archives of CIFs (default: ./Inputcifs)')
+    parser.add_argument('--blocks', action = 'store_true',
+                        help = 'decompose every data_ block of each CIF as its own MOF, named after the block')
+    parser.add_argument('-j', '--jobs', type = int, default = os.cpu_count(),
+                        help = 'number of worker processes (default: all cores)')
+    parser.add_argument('--timeout', type = float, default = None,
+                        help = 'wall-clock limit per MOF in seconds (default: none)')
+    parser.add_argument('--max-rss', type = float, default = None,
+                        help = 'resident memory limit per worker in MB (default: none)')
+    parser.add_argument('--max-tasks-per-worker', type = int, default = None,
+                        help = 'recycle a worker process after this many MOFs, also runs a single job in a worker process (default: 100, 0 for never)')
+    parser.add_argument('--resume', action = 'store_true',
+                        help = 'skip MOFs already decomposed according to the manifest, retry failures and new files')
+    parser.add_argument('--shard', type = parse_shard, default = None,
+                        help = 'process only shard i of N (0 <= i < N), chosen by a stable hash of the MOF name, into BUoutput/shard-i-of-N; combine shards with "merge"')
+    parser.add_argument('--plan', action = 'store_true',
+                        help = 'only scan the CIF headers and print the predicted atom count and time of each MOF')
+    parser.add_argument('--schedule', default = 'input', choices = ['input', 'largest-first'],
+                        help = 'order of the MOFs with several workers; input streams the inputs, largest-first scans all inputs first, reading each file twice and keeping archive members in memory (default: input)')
+    parser.add_argument('--pack', action = 'store_true',
+                        help = 'append all building blocks to BUoutput/buildingblocks.pack with an index instead of writing per-MOF files')
+    parser.add_argument('--profile', action = 'store_true',
+                        help = 'record wall and CPU time and atom, bond and fragment counts per stage and neighbor search counters in the manifest, and a summary in BUoutput/profile.json')
+    parser.add_argument('--reduce-cell', action = 'store_true',
+                        help = 'search bonds in the LLL-reduced cell of oblique inputs, the output stays in the input cell')
+    parser.add_argument('--cache', default = None,
+                        help = 'directory of cached building blocks keyed on CIF content and parameters (default: no cache)')
+    parser.add_argument('--cache-size', type = float, default = 10240,
+                        help = 'cache size limit in MB, least recently used entries are evicted (default: 10240)')
+    args = parser.parse_args()
+    if args.pack and args.cache:
+        parser.error('--cache stores per-MOF files and can not be combined with --pack')
+    
     outputdir = './BUoutput'
     faildir = './Failcifs'
     cifcell = './cifutils/cif2cell.py'
+    if args.shard is not None:
+        outputdir = shard_dir(outputdir, args.shard)
+        faildir = shard_dir(faildir, args.shard)
+    jobs = max(1, args.jobs)
+        
+    if args.plan:
+        manifest = {}
+        if args.resume:
+            manifest = read_manifest(f'{outputdir}/manifest.jsonl')
+        skipped = []
+        tasks = plan_tasks(iter_tasks(args.inputs, args.blocks, {}, manifest, skipped, args.shard), cifcell)
+        print(f'{"MOF":<40}{"sites":>8}{"Hall":>14}{"symops":>8}{"atoms":>10}{"time (s)":>12}')
+        for task in tasks:
+            plan = task['plan']
+            print(f'{task["name"]:<40}{plan["nsites"]:>8}{plan["hall"]:>14}{plan["nsymop"]:>8}{plan["natom"]:>10}{plan["cost"]:>12.2f}')
+        costs = [task['predicted'] for task in tasks]
+        print(f'Predicted: {len(tasks)} MOF(s), {sum(costs):.1f} s of work, about {predict_makespan(costs, jobs):.1f} s with {jobs} worker(s), {len(skipped)} skipped')
+        return
+    
     os.makedirs(f'{outputdir}', exist_ok=True)
     os.makedirs(f'{faildir}', exist_ok=True)
     
+    # manifest of finished inputs, one JSON record per line; a fresh run also
+    # starts a fresh failure log so it only lists failures of this run
+    manifestfile = f'{outputdir}/manifest.jsonl'
+    manifest = {}
+    if args.resume:
+        manifest = read_manifest(manifestfile)
+    else:
+        open(manifestfile,'w').close()
+        open(f'{faildir}/failures.jsonl','w').close()
+        
+    pack = None
+    if args.pack:
+        pack = PACK(f'{outputdir}/buildingblocks.pack')
+        if not args.resume or not os.path.exists(pack.packfile) or not os.path.exists(pack.indexfile):
+            pack.create()
+        else:
+            done = set(record['cif'] for record in manifest.values() if record['status'] == 'done' and pack.packfile in record['outputs'])
+            ndrop = pack.keep(done)
+            if ndrop:
+                print(f'Dropped {ndrop} pack index entries without a manifest record')
+    
+    cacheparams = ''
+    if args.cache:
+        os.makedirs(args.cache, exist_ok=True)
+        cacheparams = cache_params(cifcell)
+    
+    task = {'cif2cell': cifcell, 'outputdir': outputdir, 'pack': args.pack, 'profile': args.profile,
+            'reducecell': args.reduce_cell, 'cachedir': args.cache, 'cacheparams': cacheparams}
+    skipped = []
+    tasks = iter_tasks(args.inputs, args.blocks, task, manifest, skipped, args.shard)
+    print(f'Decomposing MOFs with up to {jobs} worker(s)')
+    if jobs > 1 and args.schedule == 'largest-first':
+        tasks = plan_tasks(tasks, cifcell)
+        costs = [task['predicted'] for task in tasks]
+        print(f'Predicted: {sum(costs):.1f} s of work, about {predict_makespan(costs, jobs):.1f} s with {jobs} worker(s)')
+    fmanifest = open(manifestfile,'a')
+    
     # loop and decompose MOFs
-    for path in pathlib.Path(inputdir).glob('*.cif') :
-        cif = os.path.basename(path)
-        cif = os.path.splitext(cif)[0]
-        print(f'Decomposing MOF "{cif}"')
-        
-        try:
-            MOFdecompose(cif2cell = cifcell, inputcif = path, outputdir = outputdir)
-        except:
-            print(f'Fail to decompose "{cif}"')
-            shutil.copy(path, faildir)
+    start = time.perf_counter()
+    nsuccess = 0
+    nfail = 0
+    ncached = 0
+    profiles = []
+    for task, result in run_tasks(tasks, jobs, args.timeout, args.max_rss, args.max_tasks_per_worker):
+        if 'fragments' in result:
+            pack.append(result['cif'], result.pop('fragments'))
+            result['outputs'] = [pack.packfile, pack.indexfile]
+        write_manifest_record(fmanifest, result)
+        if result['profile']:
+            profiles.append(result['profile'])
+        cif = result['cif']
+        if result['success']:
+            if result['cached']:
+                print(f'Decomposed MOF "{cif}": {result["nnode"]} node(s), {result["nlinker"]} linker(s), from cache')
+                ncached += 1
+            else:
+                print(f'Decomposed MOF "{cif}": {result["nnode"]} node(s), {result["nlinker"]} linker(s), {result["time"]:.2f} s')
+            nsuccess += 1
+        else:
+            if result['cause']:
+                print(f'Fail to decompose "{cif}" ({result["reason"]} in {result["stage"]}: {result["exception"]}: {result["message"]}, after {result["cause"]})')
+            elif result['exception']:
+                print(f'Fail to decompose "{cif}" ({result["reason"]} in {result["stage"]}: {result["exception"]}: {result["message"]})')
+            else:
+                print(f'Fail to decompose "{cif}" ({result["reason"]} in {result["stage"] or "startup"})')
+            save_failcif(task, faildir)
+            write_failure_record(f'{faildir}/failures.jsonl', result)
+            nfail += 1
+    fmanifest.close()
     
-    print('Decomposition Finished')
+    if args.profile:
+        summary = profile_summary(profiles)
+        f = open(f'{outputdir}/profile.json','w')
+        json.dump(summary, f, indent = 1)
+        f.close()
+        print(f'{"stage":<24}{"n":>6}{"wall p50":>12}{"wall p95":>12}{"wall max":>12}{"cpu p50":>12}{"cpu p95":>12}{"cpu max":>12}')
+        for stage, record in summary.items():
+            wall = record['wall']
+            cpu = record['cpu']
+            print(f'{stage:<24}{record["n"]:>6}{wall["p50"]:>12.4f}{wall["p95"]:>12.4f}{wall["max"]:>12.4f}'
+                  f'{cpu["p50"]:>12.4f}{cpu["p95"]:>12.4f}{cpu["max"]:>12.4f}')
     
-if __name__ == '__main__':
-    main()
+    if args.cache:
+        nevict = cache_evict(args.cache, args.cache_size)
+        print(f'Cache: {ncached} hit(s), {nevict} entry(ies) evicted')
     
+    print(f'Decomposition Finished: {nsuccess} succeeded, {nfail} failed, {len(skipped)} skipped, {time.perf_counter() - start:.2f} s')
     
+if __name__ == '__main__':
+    main()
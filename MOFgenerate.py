@@ -0,0 +1,351 @@
+import os
+import sys
+import argparse
+import datetime
+import itertools
+import numpy as np
+
+# the cell machinery of cif2cell lives in cifutils and imports its helpers from there
+cifutilsdir = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cifutils')
+if cifutilsdir not in sys.path:
+    sys.path.insert(0, cifutilsdir)
+from uctools import CellData
+from utils import LatticeMatrix, LatticeVector, AtomSite, SymmetryOperation
+
+
+# Idealized bond lengths in Angstrom
+CC_ARO = 1.39
+CC_CARB = 1.50
+CO_CARB = 1.27
+CH = 1.08
+OH = 0.96
+CO = 1.43
+OCO_HALF = np.radians(62.5)
+
+# Ring substituents of the mixed linkers and their bond length to the ring
+# carbon; every composition of four of them is a distinct linker, 35 in all
+SUBSTITUENTS = {'H': CH, 'F': 1.35, 'Cl': 1.74, 'Br': 1.90}
+LINKER_PATTERNS = list(itertools.combinations_with_replacement(SUBSTITUENTS, 4))
+
+# Solvent water positions around a pore center, in Angstrom
+SOLVENT_OFFSET = 1.6
+SOLVENT_SITES = [[sx, sy, sz] for sx in [-1, 1] for sy in [-1, 1] for sz in [-1, 1]]
+
+def unit(v):
+    v = np.array(v, dtype = float)
+    return v / np.linalg.norm(v)
+
+def add_bdc(atoms, start, axis, ringdir, olength, substituents = LINKER_PATTERNS[0]):
+
+    # terephthalate from the carboxylate carbon at start along axis, ring in the
+    # (axis, ringdir) plane; the carboxylate O of the near end sit in the plane
+    # of olength[0] and those of the far end in the plane of olength[1], the
+    # four ring positions carry substituents
+    start = np.array(start, dtype = float)
+    axis = unit(axis)
+    ringdir = unit(ringdir)
+
+    carb1 = start
+    center = carb1 + axis * (CC_CARB + CC_ARO)
+    carb2 = center + axis * (CC_ARO + CC_CARB)
+    for carb, direction, oplane in [[carb1, -axis, olength[0]], [carb2, axis, olength[1]]]:
+        atoms.append(['C', carb])
+        for sign in [-1, 1]:
+            atoms.append(['O', carb + direction * CO_CARB * np.cos(OCO_HALF) + sign * unit(oplane) * CO_CARB * np.sin(OCO_HALF)])
+
+    ring = iter(substituents)
+    for k in range(6):
+        theta = np.pi + k * np.pi / 3.0
+        radial = axis * np.cos(theta) + ringdir * np.sin(theta)
+        atoms.append(['C', center + radial * CC_ARO])
+        if k not in [0, 3]:
+            symbol = next(ring)
+            atoms.append([symbol, center + radial * (CC_ARO + SUBSTITUENTS[symbol])])
+
+def add_water(atoms, oxygen, axis = [0.0, 0.0, 1.0], side = [1.0, 0.0, 0.0]):
+
+    oxygen = np.array(oxygen, dtype = float)
+    atoms.append(['O', oxygen])
+    for sign in [-1, 1]:
+        atoms.append(['H', oxygen + unit(axis) * 0.586 + sign * unit(side) * 0.757])
+
+def add_methanol(atoms, oxygen, axis, side):
+
+    # methanol bound through O along axis, C tilted towards side
+    oxygen = np.array(oxygen, dtype = float)
+    axis = unit(axis)
+    side = unit(side)
+    tilt = np.radians(55.0)
+
+    bond = axis * np.cos(tilt) + side * np.sin(tilt)
+    carbon = oxygen + bond * CO
+    atoms.append(['O', oxygen])
+    atoms.append(['H', oxygen + (axis * np.cos(tilt) - side * np.sin(tilt)) * OH])
+    atoms.append(['C', carbon])
+
+    # methyl hydrogens staggered around the O-C bond
+    v = unit(np.cross(bond, axis))
+    w = np.cross(bond, v)
+    for k in range(3):
+        phi = k * 2.0 * np.pi / 3.0
+        atoms.append(['H', carbon + (bond * 0.3338 + (v * np.cos(phi) + w * np.sin(phi)) * 0.9426) * CH])
+
+def zn4o_bdc(funcgroup = False, linkers = None):
+
+    # IRMOF-1 like primitive cubic cell, one Zn4O(CO2)6 node at the origin and
+    # a terephthalate along each axis, Zn4O(BDC)3 = 53 atoms; linkers yields
+    # the ring substituents of each terephthalate in turn
+    if funcgroup:
+        raise ValueError('zn4o-bdc has no open metal sites for functional groups')
+    if linkers is None:
+        linkers = iter([])
+
+    d = 1.94 / np.sqrt(3.0)
+    atoms = [['O', np.zeros(3)]]
+    for zn in [[1, 1, 1], [1, -1, -1], [-1, 1, -1], [-1, -1, 1]]:
+        atoms.append(['Zn', np.array(zn) * d])
+
+    # carboxylate carbon placed for Zn-O(carboxylate) = 1.94
+    oplane = CO_CARB * np.sin(OCO_HALF) / np.sqrt(2.0)
+    ox = d + np.sqrt(1.94**2 - 2.0 * (d - oplane)**2)
+    start = ox + CO_CARB * np.cos(OCO_HALF)
+    a = 2.0 * start + 2.0 * (CC_CARB + CC_ARO)
+
+    for k in range(3):
+        axis = np.roll([1.0, 0.0, 0.0], k)
+        ringdir = np.roll([0.0, 1.0, 0.0], k)
+        near = np.roll([0.0, 1.0, 1.0], k)
+        far = np.roll([0.0, 1.0, -1.0], k)
+        add_bdc(atoms, axis * start, axis, ringdir, [near, far], next(linkers, LINKER_PATTERNS[0]))
+
+    return [a, a, a], [90.0, 90.0, 90.0], atoms, [a/2.0, a/2.0, a/2.0]
+
+def cu_paddlewheel(funcgroup = False, linkers = None):
+
+    # Cu2(BDC)2 square-grid layers stacked along c with axial water on each Cu,
+    # or with funcgroup axial methanol that break_mof keeps as a functional group;
+    # linkers yields the ring substituents of each terephthalate in turn
+    if linkers is None:
+        linkers = iter([])
+    cucu = 2.63
+    cuo = 1.95
+    cuaxial = 2.20
+    c = 13.0
+
+    oplane = CO_CARB * np.sin(OCO_HALF)
+    ox = np.sqrt(cuo**2 - (cucu/2.0 - oplane)**2)
+    start = ox + CO_CARB * np.cos(OCO_HALF)
+    a = 2.0 * start + 2.0 * (CC_CARB + CC_ARO)
+
+    atoms = []
+    for sign in [-1, 1]:
+        atoms.append(['Cu', np.array([0.0, 0.0, sign * cucu/2.0])])
+    for k in range(2):
+        axis = np.roll([1.0, 0.0, 0.0], k)
+        ringdir = np.roll([0.0, 1.0, 0.0], k)
+        add_bdc(atoms, axis * start, axis, ringdir, [[0.0, 0.0, 1.0], [0.0, 0.0, 1.0]], next(linkers, LINKER_PATTERNS[0]))
+
+    for sign in [-1, 1]:
+        oxygen = np.array([0.0, 0.0, sign * (cucu/2.0 + cuaxial)])
+        if funcgroup:
+            add_methanol(atoms, oxygen, [0.0, 0.0, sign], [sign, sign, 0.0])
+        else:
+            add_water(atoms, oxygen, [0.0, 0.0, sign], [1.0, -1.0, 0.0])
+
+    return [a, a, c], [90.0, 90.0, 90.0], atoms, [a/2.0, a/2.0, c/2.0]
+
+NETS = {'zn4o-bdc': zn4o_bdc, 'cu-paddlewheel': cu_paddlewheel}
+
+# Space groups the CIF can be written in: H-M symbol, number, cell setting and
+# the operations with their diagonal rotation; every net without functional
+# groups has the two-fold axis along c through the origin
+SPACEGROUPS = {'P1': ['P1', 1, 'triclinic', [['x,y,z', [1, 1, 1]]]],
+               'P112': ['P 1 1 2', 3, 'monoclinic', [['x,y,z', [1, 1, 1]], ['-x,-y,z', [-1, -1, 1]]]]}
+
+def cell_atoms(net, solvent = 0, funcgroup = False, linkers = None):
+
+    # lengths, angles and cartesian atoms of one unit cell of net with solvent
+    # free water molecules per cell
+    if net not in NETS:
+        raise ValueError(f'Unknown net "{net}", choose from {sorted(NETS)}')
+    if solvent < 0 or solvent > len(SOLVENT_SITES):
+        raise ValueError(f'solvent must be between 0 and {len(SOLVENT_SITES)} molecules per cell')
+
+    lengths, angles, atoms, pore = NETS[net](funcgroup, linkers)
+    for site in SOLVENT_SITES[:solvent]:
+        add_water(atoms, np.array(pore) + np.array(site) * SOLVENT_OFFSET)
+
+    return lengths, angles, atoms
+
+def make_cell(lengths, angles, atoms):
+
+    # P1 CellData of an orthogonal cell
+    cd = CellData()
+    cd.a, cd.b, cd.c = lengths
+    cd.alpha, cd.beta, cd.gamma = angles
+    cd.spacegroupnr = 1
+    cd.HMSymbol = 'P1'
+    cd.lengthscale = 1.0
+    cd.latticevectors = LatticeMatrix([[lengths[0], 0.0, 0.0], [0.0, lengths[1], 0.0], [0.0, 0.0, lengths[2]]])
+    cd.symops = set([SymmetryOperation(['x', 'y', 'z'])])
+
+    for symbol, x in atoms:
+        position = LatticeVector([float(x[idim] / lengths[idim]) for idim in range(3)])
+        position.intocell()
+        site = AtomSite(position = position, species = {symbol: 1.0}, label = symbol)
+        cd.atomdata.append([site])
+        cd.atomset.add(site)
+
+    cd.initialized = True
+    cd.numberOfAtoms = cd.natoms()
+    return cd
+
+def unit_cell(net, solvent = 0, funcgroup = False):
+    return make_cell(*cell_atoms(net, solvent, funcgroup))
+
+def mixed_cell(net, n, solvent = 0, funcgroup = False):
+
+    # n x n x n supercell built cell by cell, every terephthalate with the next
+    # ring substitution pattern, so up to len(LINKER_PATTERNS) linkers differ
+    linkers = itertools.cycle(LINKER_PATTERNS)
+    atoms = []
+    for shift in itertools.product(range(n), repeat = 3):
+        lengths, angles, cell = cell_atoms(net, solvent, funcgroup, linkers)
+        atoms += [[symbol, x + np.array(shift) * lengths] for symbol, x in cell]
+    return make_cell([n * length for length in lengths], angles, atoms)
+
+def generate(net, n = 1, solvent = 0, funcgroup = False, mixed = False):
+
+    # n x n x n supercell of the unit cell
+    if mixed:
+        return mixed_cell(net, n, solvent, funcgroup)
+    cd = unit_cell(net, solvent, funcgroup)
+    if n > 1:
+        cd.getSuperCell([n, n, n], [0, 0, 0], [0.0, 0.0, 0.0])
+    return cd
+
+def size_for_atoms(net, natom, solvent = 0, funcgroup = False):
+
+    # smallest n giving at least natom atoms
+    ncell = unit_cell(net, solvent, funcgroup).natoms()
+    n = 1
+    while n**3 * ncell < natom:
+        n += 1
+    return n
+
+def site_key(x):
+    return tuple(int(v) for v in np.round(np.array(x) * 1e4).astype(int) % 10000)
+
+def asymmetric_unit(sites, signs):
+
+    # first site of each orbit under the operations x -> signs * x, the
+    # structure must map onto itself under every operation
+    index = {site_key(x): i for i, [symbol, x] in enumerate(sites)}
+    keep = []
+    covered = set()
+    for i, [symbol, x] in enumerate(sites):
+        if i in covered:
+            continue
+        keep.append(i)
+        for isigns in signs:
+            j = index.get(site_key((np.array(isigns) * x) % 1.0))
+            if j is None or sites[j][0] != symbol:
+                raise ValueError('The structure does not have the symmetry of the space group')
+            covered.add(j)
+    return keep
+
+def write_cif(cd, ciffile, name, spacegroup = 'P1'):
+
+    # all sites in P1, or the asymmetric unit with the symmetry operations
+    hm, number, setting, ops = SPACEGROUPS[spacegroup]
+    lengths = [cd.latticevectors[idim].length() * cd.lengthscale for idim in range(3)]
+    sites = [[b.spcstring(), np.array([b.position[idim] % 1.0 for idim in range(3)])] for a in cd.atomdata for b in a]
+    keep = asymmetric_unit(sites, [signs for op, signs in ops])
+
+    f = open(ciffile,'w')
+    f.write(f'data_{name}\n')
+    today = datetime.date.today()
+    date = today.strftime("%Y-%m-%d")
+    f.write('_audit_creation_date\t\t\t%s\n' %date)
+    f.write('_audit_creation_method\t\t\t\'MOFgenerate\'\n')
+    f.write('_symmetry_space_group_name_H-M\t\t\'%s\'\n' %hm)
+    f.write('_symmetry_Int_Tables_number\t\t%d\n' %number)
+    f.write('_symmetry_cell_setting\t\t\t%s\n' %setting)
+    f.write('loop_\n')
+    f.write('_symmetry_equiv_pos_as_xyz\n')
+    for op, signs in ops:
+        f.write(f'\t{op}\n')
+    f.write('_cell_length_a\t\t\t\t%-10.6f\n' %lengths[0])
+    f.write('_cell_length_b\t\t\t\t%-10.6f\n' %lengths[1])
+    f.write('_cell_length_c\t\t\t\t%-10.6f\n' %lengths[2])
+    f.write('_cell_angle_alpha\t\t\t%-10.6f\n' %cd.alpha)
+    f.write('_cell_angle_beta\t\t\t%-10.6f\n' %cd.beta)
+    f.write('_cell_angle_gamma\t\t\t%-10.6f\n' %cd.gamma)
+    f.write('loop_\n')
+    f.write('_atom_site_label\n')
+    f.write('_atom_site_type_symbol\n')
+    f.write('_atom_site_fract_x\n')
+    f.write('_atom_site_fract_y\n')
+    f.write('_atom_site_fract_z\n')
+    f.write('_atom_site_occupancy\n')
+    count = 0
+    for i in keep:
+        symbol, x = sites[i]
+        count += 1
+        f.write(f'{symbol}{count}\t{symbol}')
+        for idim in range(3):
+            f.write('\t%-10.6f' %x[idim])
+        f.write('\t1.00\n')
+    f.close()
+
+    return count
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Generate CIFs of idealized MOFs for benchmarking')
+    parser.add_argument('--net', default = 'zn4o-bdc', choices = sorted(NETS),
+                        help = 'framework (default: zn4o-bdc)')
+    parser.add_argument('-n', '--size', type = int, default = 1,
+                        help = 'n x n x n supercell (default: 1)')
+    parser.add_argument('--atoms', type = int, default = None,
+                        help = 'choose the smallest supercell with at least this many atoms instead of --size')
+    parser.add_argument('--solvent', type = int, default = 0,
+                        help = f'free water molecules per unit cell, 0 to {len(SOLVENT_SITES)} (default: 0)')
+    parser.add_argument('--funcgroup', action = 'store_true',
+                        help = 'coordinate a methanol to each open metal site (cu-paddlewheel only)')
+    parser.add_argument('--mixed-linkers', action = 'store_true',
+                        help = f'substitute the ring hydrogens of every linker with a different pattern of F, Cl and Br, up to {len(LINKER_PATTERNS)} distinct linkers')
+    parser.add_argument('--spacegroup', default = 'P1', choices = sorted(SPACEGROUPS),
+                        help = 'write all atoms in P1 or the asymmetric unit in P 1 1 2, which cif2cell expands (default: P1)')
+    parser.add_argument('-o', '--output', default = './Inputcifs',
+                        help = 'output directory (default: ./Inputcifs)')
+    args = parser.parse_args()
+
+    try:
+        n = args.size
+        if args.atoms is not None:
+            n = size_for_atoms(args.net, args.atoms, args.solvent, args.funcgroup)
+        cd = generate(args.net, n, args.solvent, args.funcgroup, args.mixed_linkers)
+    except ValueError as e:
+        parser.error(str(e))
+
+    name = f'{args.net}_{n}x{n}x{n}'
+    if args.solvent:
+        name += f'_solvent{args.solvent}'
+    if args.funcgroup:
+        name += '_funcgroup'
+    if args.mixed_linkers:
+        name += '_mixed'
+    if args.spacegroup != 'P1':
+        name += f'_{args.spacegroup}'
+    name = name.replace('-', '_')
+
+    os.makedirs(args.output, exist_ok=True)
+    try:
+        natom = write_cif(cd, f'{args.output}/{name}.cif', name, args.spacegroup)
+    except ValueError as e:
+        parser.error(str(e))
+    print(f'Generated "{args.output}/{name}.cif": {natom} atoms')
+
+if __name__ == '__main__':
+    main()
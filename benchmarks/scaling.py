@@ -0,0 +1,282 @@
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import itertools
+import numpy as np
+
+benchdir = os.path.dirname(os.path.abspath(__file__))
+rootdir = os.path.dirname(benchdir)
+if rootdir not in sys.path:
+    sys.path.insert(0, rootdir)
+import MOFdecompose as MD
+import MOFgenerate as MG
+from uctools import CellData
+
+CIF2CELL = os.path.join(rootdir, 'cifutils', 'cif2cell.py')
+
+# Functions suspected of O(N^2) behavior, timed by wrapping them in a separate pass.
+# write_cif holds the bondpairlist membership test; getCrystalStructure holds the
+# duplicate weeding of cif2cell (CellData.duplicates is never called). P1 inputs
+# are read without cif2cell, so it only runs on the P 1 1 2 asymmetric units.
+HOTSPOTS = [['check_uniq_fragmentlist', MD.MOF, 'check_uniq_fragmentlist'],
+            ['get_label', MD.MOF, 'get_label'],
+            ['write_cif', MD.MOF, 'write_cif'],
+            ['CellData.getCrystalStructure', CellData, 'getCrystalStructure']]
+
+# Exponent from which a stage or hotspot is flagged as quadratic
+QUADRATIC = 1.5
+
+# Times below this are too noisy to fit
+MINTIME = 1e-4
+
+class HOTSPOT:
+
+    def __init__ (self, name, owner, attr):
+
+        self.name = name
+        self.owner = owner
+        self.attr = attr
+        self.func = getattr(owner, attr)
+        self.time = 0.0
+        self.calls = 0
+
+    def install(self):
+
+        func = self.func
+        hotspot = self
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                hotspot.time += time.perf_counter() - start
+                hotspot.calls += 1
+        setattr(self.owner, self.attr, wrapper)
+
+    def uninstall(self):
+        setattr(self.owner, self.attr, self.func)
+
+def run_once(ciffile, workdir, hotspots = None):
+
+    # one MOFdecompose of ciffile, returns total wall time and the STAGES records
+    stages = MD.STAGES(profile = True)
+    if hotspots:
+        for ihotspot in hotspots:
+            ihotspot.install()
+    start = time.perf_counter()
+    try:
+        natom, nnode, nlinker = MD.MOFdecompose(cif2cell = CIF2CELL, inputcif = ciffile, outputdir = workdir, stages = stages)
+    finally:
+        total = time.perf_counter() - start
+        if hotspots:
+            for ihotspot in hotspots:
+                ihotspot.uninstall()
+
+    return total, natom, stages.records
+
+def series_name(net, spacegroup, linkers):
+
+    # runs are grouped and compared by this name, plain P1 keeps the bare net name
+    name = net
+    if spacegroup != 'P1':
+        name += f' {spacegroup}'
+    if linkers != 'plain':
+        name += f' {linkers}'
+    return name
+
+def bench_size(net, spacegroup, linkers, n, repeat, workdir):
+
+    ciffile = f'{workdir}/{net}_{spacegroup}_{linkers}_{n}.cif'
+    ncif = MG.write_cif(MG.generate(net, n, mixed = linkers == 'mixed'), ciffile, f'{net}_{n}', spacegroup)
+
+    # stage times, best of repeat
+    best = None
+    for i in range(repeat):
+        total, natom, records = run_once(ciffile, workdir)
+        if best is None or total < best[0]:
+            best = [total, natom, records]
+    total, natom, records = best
+
+    # hotspot times in a separate pass, the wrappers add overhead to the stages
+    hotspots = [HOTSPOT(*ihotspot) for ihotspot in HOTSPOTS]
+    run_once(ciffile, workdir, hotspots)
+
+    return {'net': series_name(net, spacegroup, linkers), 'spacegroup': spacegroup, 'linkers': linkers, 'n': n, 'natom': natom, 'ncif': ncif, 'total': total,
+            'stages': {stage: record['wall'] for stage, record in records.items()},
+            'hotspots': {ihotspot.name: {'time': ihotspot.time, 'calls': ihotspot.calls} for ihotspot in hotspots}}
+
+def fit_exponent(natoms, times):
+
+    # slope of log(time) against log(natom), None with fewer than two usable points
+    points = [[natom, t] for natom, t in zip(natoms, times) if t > MINTIME]
+    if len(set(natom for natom, t in points)) < 2:
+        return None
+    x = np.log([natom for natom, t in points])
+    y = np.log([t for natom, t in points])
+    return float(np.polyfit(x, y, 1)[0])
+
+def get_metrics(runs):
+
+    # metric name -> [natom list, time list] over the runs of one net
+    metrics = {'total': [[], []]}
+    for run in runs:
+        metrics['total'][0].append(run['natom'])
+        metrics['total'][1].append(run['total'])
+        for stage, t in run['stages'].items():
+            metrics.setdefault(f'stage:{stage}', [[], []])
+            metrics[f'stage:{stage}'][0].append(run['natom'])
+            metrics[f'stage:{stage}'][1].append(t)
+        for name, hotspot in run['hotspots'].items():
+            metrics.setdefault(f'hotspot:{name}', [[], []])
+            metrics[f'hotspot:{name}'][0].append(run['natom'])
+            metrics[f'hotspot:{name}'][1].append(hotspot['time'])
+    return metrics
+
+def analyse(runs):
+
+    # scaling exponents per net and metric and the metrics flagged as quadratic
+    exponents = {}
+    flags = []
+    for net in sorted(set(run['net'] for run in runs)):
+        netruns = sorted([run for run in runs if run['net'] == net], key = lambda run: run['natom'])
+        exponents[net] = {}
+        for metric, [natoms, times] in get_metrics(netruns).items():
+            exponent = fit_exponent(natoms, times)
+            exponents[net][metric] = exponent
+            if exponent is not None and exponent >= QUADRATIC:
+                flags.append({'net': net, 'metric': metric, 'exponent': exponent})
+    return exponents, flags
+
+def compare(report, baseline, exptol, timetol):
+
+    # regressions against a baseline report: exponents grown by more than exptol,
+    # or times at the largest common size grown by more than a factor timetol
+    regressions = []
+    for net, netexponents in report['exponents'].items():
+        for metric, exponent in netexponents.items():
+            old = baseline['exponents'].get(net, {}).get(metric)
+            if exponent is not None and old is not None and exponent > old + exptol:
+                regressions.append(f'{net} {metric}: exponent {old:.2f} -> {exponent:.2f}')
+
+        runs = {run['natom']: run for run in report['runs'] if run['net'] == net}
+        oldruns = {run['natom']: run for run in baseline['runs'] if run['net'] == net}
+        common = sorted(set(runs) & set(oldruns))
+        if len(common) == 0:
+            continue
+        new = get_metrics([runs[common[-1]]])
+        old = get_metrics([oldruns[common[-1]]])
+        for metric, [natoms, times] in new.items():
+            if metric not in old:
+                continue
+            t = times[0]
+            oldt = old[metric][1][0]
+            if t > MINTIME and oldt > MINTIME and t > oldt * timetol:
+                regressions.append(f'{net} {metric}: {oldt:.4f} s -> {t:.4f} s at {common[-1]} atoms')
+    return regressions
+
+def write_markdown(report, mdfile):
+
+    f = open(mdfile,'w')
+    f.write('# MOFdecompose scaling report\n\n')
+    for net, netexponents in report['exponents'].items():
+        runs = sorted([run for run in report['runs'] if run['net'] == net], key = lambda run: run['natom'])
+        metrics = get_metrics(runs)
+        f.write(f'## {net}\n\n')
+        f.write('| metric | ' + ' | '.join(f'{run["natom"]} atoms' for run in runs) + ' | exponent |\n')
+        f.write('|---|' + '---|' * len(runs) + '---|\n')
+        for metric, [natoms, times] in metrics.items():
+            exponent = netexponents.get(metric)
+            if exponent is None:
+                text = '-'
+            else:
+                text = f'{exponent:.2f}'
+                if exponent >= QUADRATIC:
+                    text += ' **quadratic**'
+            f.write(f'| {metric} | ' + ' | '.join(f'{t:.4f}' for t in times) + f' | {text} |\n')
+        f.write('\n')
+
+    if report['flags']:
+        f.write(f'## Flagged (exponent >= {QUADRATIC})\n\n')
+        for flag in report['flags']:
+            f.write(f'- {flag["net"]} {flag["metric"]}: {flag["exponent"]:.2f}\n')
+        f.write('\n')
+    if 'regressions' in report:
+        f.write('## Baseline comparison\n\n')
+        if report['regressions']:
+            for regression in report['regressions']:
+                f.write(f'- {regression}\n')
+        else:
+            f.write('No regressions.\n')
+    f.close()
+
+def main():
+
+    parser = argparse.ArgumentParser(description = 'Time the MOFdecompose stages on generated MOFs of growing size and fit scaling exponents')
+    parser.add_argument('--nets', nargs = '+', default = sorted(MG.NETS), choices = sorted(MG.NETS),
+                        help = 'generated frameworks to run (default: all)')
+    parser.add_argument('--spacegroups', nargs = '+', default = sorted(MG.SPACEGROUPS), choices = sorted(MG.SPACEGROUPS),
+                        help = 'write each input with all atoms in P1 or as the P 1 1 2 asymmetric unit expanded by cif2cell (default: both)')
+    parser.add_argument('--linkers', nargs = '+', default = ['plain', 'mixed'], choices = ['plain', 'mixed'],
+                        help = 'one kind of linker, or a different halogen pattern on every linker so the distinct linkers grow with the size; mixed runs only in P1 (default: both)')
+    parser.add_argument('--sizes', nargs = '+', type = int, default = [1, 2, 3],
+                        help = 'n x n x n supercells to run (default: 1 2 3)')
+    parser.add_argument('--repeat', type = int, default = 3,
+                        help = 'best of this many runs per size (default: 3)')
+    parser.add_argument('--output', default = os.path.join(benchdir, 'results'),
+                        help = 'directory for scaling.json and scaling.md (default: benchmarks/results)')
+    parser.add_argument('--baseline', default = None,
+                        help = 'scaling.json of an earlier run to compare against, exit 1 on regressions')
+    parser.add_argument('--exponent-tolerance', type = float, default = 0.25,
+                        help = 'allowed growth of a scaling exponent over the baseline (default: 0.25)')
+    parser.add_argument('--time-tolerance', type = float, default = 1.5,
+                        help = 'allowed time ratio over the baseline at the largest common size (default: 1.5)')
+    args = parser.parse_args()
+
+    # import cif2cell once so the first run does not pay for it
+    MD.import_cif2cell(CIF2CELL)
+    workdir = tempfile.mkdtemp(prefix = 'mofbench')
+    runs = []
+    try:
+        for net in args.nets:
+            for spacegroup, linkers in itertools.product(args.spacegroups, args.linkers):
+                # the halogen patterns break the two-fold axis
+                if linkers == 'mixed' and spacegroup != 'P1':
+                    continue
+                for n in sorted(args.sizes):
+                    run = bench_size(net, spacegroup, linkers, n, args.repeat, workdir)
+                    runs.append(run)
+                    print(f'{run["net"]} {n}x{n}x{n}: {run["natom"]} atoms, {run["total"]:.3f} s')
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    exponents, flags = analyse(runs)
+    report = {'sizes': sorted(args.sizes), 'repeat': args.repeat, 'runs': runs, 'exponents': exponents, 'flags': flags}
+    for flag in flags:
+        print(f'Quadratic: {flag["net"]} {flag["metric"]} exponent {flag["exponent"]:.2f}')
+
+    status = 0
+    if args.baseline:
+        f = open(args.baseline,'r')
+        baseline = json.load(f)
+        f.close()
+        report['regressions'] = compare(report, baseline, args.exponent_tolerance, args.time_tolerance)
+        for regression in report['regressions']:
+            print(f'Regression: {regression}')
+        if report['regressions']:
+            status = 1
+
+    os.makedirs(args.output, exist_ok=True)
+    f = open(f'{args.output}/scaling.json','w')
+    json.dump(report, f, indent = 1)
+    f.close()
+    write_markdown(report, f'{args.output}/scaling.md')
+    print(f'Report written to "{args.output}/scaling.json" and "{args.output}/scaling.md"')
+
+    sys.exit(status)
+
+if __name__ == '__main__':
+    main()